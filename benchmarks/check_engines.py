@@ -0,0 +1,110 @@
+from lib.data import load_measurements, fmodes
+from lib.aggregate import aggregate_measurements, aggregate_sort_data, period_to_columns
+from lib.state import State
+
+import numpy as np
+from argparse import ArgumentParser
+from contextlib import redirect_stdout
+from io import StringIO
+from os.path import abspath, dirname, join
+
+
+"""
+Consistency check of the vectorized engines against the row by row reference engines.
+
+For each fixture, fill mode and period, checks that:
+    Vectorized and row by row normalization in "load_measurements" give the same measurements
+    Vectorized and dictionary aggregation in "aggregate_measurements" give the same groups
+    Aggregation of the program state (roll-up levels of compact time keys) gives the same groups
+Also checks the known row counts of "testdata2.csv", which has the invalid date 2006-09-31 kept in September.
+
+Run from the root folder with:
+    python -m benchmarks.check_engines
+Exits with status 1 if any check fails.
+"""
+
+
+#Root folder of the program
+root_folder = dirname(dirname(abspath(__file__)))
+
+#Fixtures checked by default
+fixtures = ["testdata.csv", "testdata1.csv", "testdata2.csv"]
+
+#Known number of loaded rows of fixtures per fill mode
+#NOTE: "testdata2.csv" has a corrupted last row, so "backward fill" falls back to "drop"
+expected_rows = {
+    "testdata2.csv": {"forward fill": 4, "backward fill": 2, "drop": 2},
+}
+
+
+def sort_by_times(tvec, data):
+    """
+    Sorts measurements by their time columns, as the dictionary aggregation returns groups unsorted.
+    """
+    order = np.lexsort(tvec.T[::-1])
+    return (tvec[order], data[order])
+
+def same_measurements(a, b):
+    """
+    Returns whether measurements "a" and "b" have equal times and (nearly) equal zone measurements.
+    """
+    return (a[0].shape == b[0].shape and a[1].shape == b[1].shape
+            and np.array_equal(a[0], b[0]) and np.allclose(a[1], b[1]))
+
+def check_fixture(path, name):
+    """
+    Runs all checks on the fixture file at "path". Returns a list of failure messages.
+    """
+    failures = []
+
+    for fmode in fmodes:
+        #NOTE: Fill mode fallbacks are reported by both loads, as expected for some fixtures
+        measurements = load_measurements(path, fmode, use_cache=False)
+        reference = load_measurements(path, fmode, vectorized=False)
+
+        if not same_measurements(measurements, reference):
+            failures.append(f"{name}, {fmode}: vectorized and row by row loading differ")
+
+        expected = expected_rows.get(name, {}).get(fmode)
+        if expected is not None and len(measurements[0]) != expected:
+            failures.append(f"{name}, {fmode}: loaded {len(measurements[0])} rows, expected {expected}")
+
+        state = State()
+        state.set_raw_data(measurements)
+
+        for period in period_to_columns:
+            vectorized = aggregate_measurements(*measurements, period)
+            reference = sort_by_times(*aggregate_measurements(*measurements, period, vectorized=False))
+
+            if not same_measurements(vectorized, reference):
+                failures.append(f"{name}, {fmode}, {period}: vectorized and dictionary aggregation differ")
+
+            state.aggregation_mode = period
+            with redirect_stdout(StringIO()):
+                aggregate_sort_data(state)
+
+            if not same_measurements(state.aggregated_data, reference):
+                failures.append(f"{name}, {fmode}, {period}: program state and dictionary aggregation differ")
+
+    return failures
+
+
+def main():
+    parser = ArgumentParser(description="Check the vectorized engines against the row by row reference engines.")
+    parser.add_argument("files", nargs="*", default=[join(root_folder, fixture) for fixture in fixtures],
+                        help="Measurement files to check (default: the fixtures of the root folder)")
+    options = parser.parse_args()
+
+    failures = []
+    for path in options.files:
+        failures.extend(check_fixture(path, path.replace("\\", "/").split("/")[-1]))
+
+    for failure in failures:
+        print(failure)
+    print(f"{len(options.files)} files checked, {len(failures)} failures")
+
+    raise SystemExit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
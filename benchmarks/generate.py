@@ -0,0 +1,155 @@
+from lib.data_fill_processors import time_data_length, zone_data_length
+from lib.epochs import epochs_to_times, times_to_epochs, seconds_per_minute, seconds_per_day
+
+import numpy as np
+from argparse import ArgumentParser
+
+
+"""
+Synthetic meter data generator.
+
+Generates minute-resolution measurements of four zones in the same headerless CSV format as "testdata.csv",
+with a chosen amount of corrupted measurements and gaps (missing minutes).
+
+Run from the root folder with e.g.:
+    python -m benchmarks.generate synthetic.csv --rows 1000000 --corruption-rate 0.01
+"""
+
+
+#Number of rows generated and written at a time, to bound memory for very large files
+generate_chunk_rows = 1_000_000
+
+#Corruption patterns
+#   "scattered": Each zone measurement is corrupted independently
+#   "bursts": Whole runs of rows are corrupted, like a meter dropping out
+corruption_patterns = ["scattered", "bursts"]
+
+#Mean length of corrupted runs in rows when corruption pattern is "bursts"
+burst_length = 30
+
+
+
+def generate_epochs(rows, start_epoch, gap_rate, gap_length, rng):
+    """
+    Generates "rows" sorted measurement times in seconds since epoch one minute apart.
+    Each minute starts a gap of missing minutes with probability "gap_rate",
+    and gap lengths are geometrically distributed with mean "gap_length".
+    """
+    #Step one minute, plus the length of any gap
+    gaps = np.where(rng.random(rows) < gap_rate, rng.geometric(1 / max(gap_length, 1), rows), 0)
+    steps = (1 + gaps) * seconds_per_minute
+    steps[0] = 0
+
+    return start_epoch + np.cumsum(steps)
+
+
+def generate_zones(epochs, rng):
+    """
+    Generates zone measurements with a daily usage pattern, random appliance spikes, and one decimal of precision.
+    """
+    rows = len(epochs)
+
+    #Base load of each zone with a daily cycle peaking in the evening
+    day_fraction = (epochs % seconds_per_day) / seconds_per_day
+    daily_cycle = 1 + np.sin(2 * np.pi * (day_fraction - 0.5))
+    base_load = np.array([2.0, 1.0, 8.0, 6.0])
+    zones = base_load * daily_cycle[:, None] + rng.gamma(1.5, 1.0, (rows, zone_data_length))
+
+    #Occasional appliance spikes
+    spikes = rng.random((rows, zone_data_length)) < 0.02
+    zones[spikes] += rng.uniform(15, 40, spikes.sum())
+
+    return np.round(zones, 1)
+
+
+def corrupt_zones(zones, corruption_rate, corruption_pattern, rng):
+    """
+    Replaces a fraction "corruption_rate" of zone measurements with corruption markers (-1).
+    See "corruption_patterns".
+    """
+    rows = len(zones)
+
+    #If scattered, corrupt each zone measurement independently
+    if corruption_pattern == "scattered":
+        zones[rng.random(zones.shape) < corruption_rate] = -1
+    #Else, corrupt whole runs of rows
+    else:
+        starts = np.flatnonzero(rng.random(rows) < corruption_rate / burst_length)
+        lengths = rng.geometric(1 / burst_length, len(starts))
+        corrupted = np.zeros(rows + 1, dtype=np.int64)
+        np.add.at(corrupted, starts, 1)
+        np.add.at(corrupted, np.minimum(starts + lengths, rows), -1)
+        zones[np.cumsum(corrupted[:-1]) > 0] = -1
+
+    return zones
+
+
+def generate_measurements(rows, corruption_rate=0.01, corruption_pattern="scattered",
+                          gap_rate=0.0, gap_length=10, start_epoch=None, seed=0):
+    """
+    Generates synthetic measurements and returns a tuple of (N, 6) times and (N, 4) zones,
+    in the raw format of a measurement file (with corruption markers).
+    The first and last rows are never corrupted, so every fill mode can be applied.
+    """
+    rng = np.random.default_rng(seed)
+    start_epoch = times_to_epochs(np.array([[2008, 1, 1, 0, 0, 0]]))[0] if start_epoch is None else start_epoch
+
+    epochs = generate_epochs(rows, start_epoch, gap_rate, gap_length, rng)
+    zones = generate_zones(epochs, rng)
+    (first_zone, last_zone) = (zones[0].copy(), zones[-1].copy())
+
+    #Corrupt all but the first and last rows
+    zones = corrupt_zones(zones, corruption_rate, corruption_pattern, rng)
+    (zones[0], zones[-1]) = (first_zone, last_zone)
+
+    return (epochs_to_times(epochs), zones)
+
+
+def write_measurements(path, rows, seed=0, start_epoch=None, **options):
+    """
+    Generates synthetic measurements and writes them to a headerless CSV file.
+    Measurements are generated and written in chunks of "generate_chunk_rows",
+    so files far larger than memory can be generated.
+    "start_epoch" is the time of the first measurement in seconds since epoch, see "generate_measurements".
+    Other "options" are passed on to "generate_measurements".
+    """
+    import pandas
+
+    with open(path, "w", newline="") as file:
+        for chunk, offset in enumerate(range(0, rows, generate_chunk_rows)):
+            chunk_rows = min(generate_chunk_rows, rows - offset)
+            (times, zones) = generate_measurements(chunk_rows, start_epoch=start_epoch, seed=seed + chunk, **options)
+
+            #Continue the next chunk one minute after this chunk
+            start_epoch = times_to_epochs(times[-1:])[0] + seconds_per_minute
+
+            #Write times as integers and zones with one decimal
+            rows_frame = pandas.DataFrame(np.hstack((times, zones)))
+            rows_frame = rows_frame.astype({ c: np.int64 for c in range(time_data_length) })
+            rows_frame.to_csv(file, header=False, index=False, float_format="%.1f")
+
+
+
+def main():
+    parser = ArgumentParser(description="Generate synthetic minute-resolution four-zone meter data.")
+    parser.add_argument("path", help="CSV file to write.")
+    parser.add_argument("--rows", type=int, default=100_000, help="Number of measurements (default: 100000).")
+    parser.add_argument("--corruption-rate", type=float, default=0.01,
+                        help="Fraction of corrupted zone measurements (default: 0.01).")
+    parser.add_argument("--corruption-pattern", choices=corruption_patterns, default="scattered",
+                        help="How corruption is distributed (default: scattered).")
+    parser.add_argument("--gap-rate", type=float, default=0.0,
+                        help="Probability of a gap of missing minutes after each measurement (default: 0).")
+    parser.add_argument("--gap-length", type=float, default=10, help="Mean gap length in minutes (default: 10).")
+    parser.add_argument("--start-epoch", type=int,
+                        help="Time of the first measurement in seconds since epoch (default: 2008-01-01).")
+    parser.add_argument("--seed", type=int, default=0, help="Random seed (default: 0).")
+    options = parser.parse_args()
+
+    write_measurements(options.path, options.rows, seed=options.seed, start_epoch=options.start_epoch,
+                       corruption_rate=options.corruption_rate, corruption_pattern=options.corruption_pattern,
+                       gap_rate=options.gap_rate, gap_length=options.gap_length)
+
+
+if __name__ == "__main__":
+    main()
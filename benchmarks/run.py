@@ -0,0 +1,236 @@
+from benchmarks.generate import write_measurements, corruption_patterns
+from lib.data import load_measurements, fmodes
+from lib.cache import clear_cache, get_cache_folder, list_cache_files
+from lib.aggregate import aggregate_measurements, aggregate_sort_data, period_to_columns
+from lib.statistics import print_statistics
+from lib.plot import times_to_axis, decimate_indexes, line_plot_max_points
+from lib.state import State
+from lib.time_index import build_prefix_sums, bucket_totals
+from lib.epochs import times_to_epochs
+from lib.rolling import rolling_means, rolling_windows
+
+import json
+import numpy as np
+from argparse import ArgumentParser
+from contextlib import redirect_stdout
+from datetime import datetime, timezone
+from io import StringIO
+from os.path import abspath, dirname, exists, join
+from platform import python_version
+from subprocess import run
+from tempfile import TemporaryDirectory
+from time import perf_counter
+from tracemalloc import start as start_tracing, stop as stop_tracing, get_traced_memory, reset_peak
+
+
+"""
+Benchmark suite of the data pipeline.
+
+For each size, synthetic measurements are generated (see "benchmarks/generate.py"),
+and each pipeline stage is timed and its peak memory measured:
+    "load_measurements" for each fill mode, and from the binary cache
+    "aggregate_measurements" for each period
+    "aggregate_sort_data"
+    Prefix sums, bucket totals and rolling means
+    "print_statistics"
+    Plot preparation (decimation and axis conversion of each zone)
+
+Results are printed as a table and can be written to a JSON file to compare across versions, e.g.:
+    python -m benchmarks.run --sizes 10000 1000000 --output before.json
+    python -m benchmarks.run --sizes 10000 1000000 --output after.json --compare before.json
+"""
+
+
+#Root folder of the program
+root_folder = dirname(dirname(abspath(__file__)))
+
+#Default sizes in rows
+default_sizes = [10_000, 100_000, 1_000_000]
+
+
+
+def measure(stage, repeats):
+    """
+    Runs "stage" (a function of arity 0) and returns a tuple "(seconds, peak_bytes)".
+    "seconds" is the best of "repeats" runs without tracing,
+    while "peak_bytes" is the peak traced memory allocated during a separate traced run.
+    """
+    #Time without tracing, as tracing slows down allocations
+    seconds = np.inf
+    for _ in range(repeats):
+        start = perf_counter()
+        stage()
+        seconds = min(seconds, perf_counter() - start)
+
+    #Measure peak memory allocated by the stage
+    start_tracing()
+    reset_peak()
+    (baseline_bytes, _) = get_traced_memory()
+    stage()
+    (_, peak_bytes) = get_traced_memory()
+    stop_tracing()
+
+    return (seconds, peak_bytes - baseline_bytes)
+
+
+def quiet(function):
+    """
+    Returns a function that calls "function" with standard output discarded
+    """
+    def call():
+        with redirect_stdout(StringIO()):
+            function()
+
+    return call
+
+
+def prepare_plot(times, zones):
+    """
+    Prepares zones for line plots like "draw_line_plot" without drawing them.
+    """
+    for i in range(zones.shape[1]):
+        indexes = decimate_indexes(zones[:, i], line_plot_max_points)
+        times_to_axis(times[indexes])
+
+
+def create_stages(path, tvec, data):
+    """
+    Returns a list of tuples "(stage name, stage function)" for measurements loaded from "path".
+    """
+    stages = []
+
+    #Loading with each fill mode, bypassing the cache
+    for fmode in fmodes:
+        stages.append((f"load_measurements ({fmode})",
+                       lambda fmode=fmode: load_measurements(path, fmode, use_cache=False)))
+
+    #Loading with the data frame parser instead of the typed parser
+    stages.append(("load_measurements (drop, untyped)",
+                   lambda: load_measurements(path, "drop", use_cache=False, typed_parser=False)))
+
+    #Loading from the cache, unless the measurements are too large to be cached
+    load_measurements(path, "drop")
+    if exists(get_cache_folder(path)) and len(list_cache_files(get_cache_folder(path))) > 0:
+        stages.append(("load_measurements (cached)", lambda: load_measurements(path, "drop")))
+    else:
+        print(f"Skipping load_measurements (cached) of {len(tvec)} rows, as they are larger than the cache")
+
+    #Aggregating with each period
+    for period in period_to_columns:
+        stages.append((f"aggregate_measurements ({period})",
+                       lambda period=period: aggregate_measurements(tvec, data, period)))
+
+    #Aggregating and sorting through the program state without cached aggregations
+    def aggregate_state():
+        state = State()
+        state.set_raw_data((tvec, data))
+        aggregate_sort_data(state)
+
+    stages.append(("aggregate_sort_data", quiet(aggregate_state)))
+
+    #Building the prefix-sum index, and summing 15 minute buckets with it
+    (epochs, prefix_sums) = (times_to_epochs(tvec), build_prefix_sums(data))
+    stages.append(("build_prefix_sums", lambda: build_prefix_sums(data)))
+    stages.append(("bucket_totals (15 minutes)", lambda: bucket_totals(epochs, prefix_sums, 15 * 60)))
+
+    #Moving average over each rolling window
+    for window_name, window in rolling_windows.items():
+        stages.append((f"rolling_means ({window_name})", lambda window=window: rolling_means(epochs, data, window)))
+
+    #Statistics and plot preparation on aggregated data
+    aggregated_data = aggregate_measurements(tvec, data, "minute")
+    stages.append(("print_statistics", quiet(lambda: print_statistics(*aggregated_data))))
+    stages.append(("plot preparation", lambda: prepare_plot(*aggregated_data)))
+
+    return stages
+
+
+
+def get_version():
+    """
+    Returns the git commit of the program, or "unknown" if unavailable
+    """
+    try:
+        result = run(["git", "describe", "--always", "--dirty"], cwd=root_folder,
+                     capture_output=True, text=True, check=True)
+        return result.stdout.strip()
+    except Exception:
+        return "unknown"
+
+
+def print_result(result, previous=None):
+    """
+    Prints a result row, with the speedup relative to a previous result if given
+    """
+    speedup = "" if previous is None else f"{previous['seconds'] / result['seconds']:8.2f}x"
+    print(f"{result['rows']:>11} {result['stage']:<40} {result['seconds'] * 1000:10.1f} ms "
+          f"{result['rows_per_second']:14.0f} rows/s {result['peak_bytes'] / 1024 ** 2:9.1f} MiB {speedup}")
+
+
+def main():
+    parser = ArgumentParser(description="Benchmark the data pipeline on synthetic meter data.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=default_sizes,
+                        help="Numbers of rows to benchmark (default: 10000 100000 1000000).")
+    parser.add_argument("--corruption-rate", type=float, default=0.01,
+                        help="Fraction of corrupted zone measurements (default: 0.01).")
+    parser.add_argument("--corruption-pattern", choices=corruption_patterns, default="scattered",
+                        help="How corruption is distributed (default: scattered).")
+    parser.add_argument("--gap-rate", type=float, default=0.001,
+                        help="Probability of a gap of missing minutes after each measurement (default: 0.001).")
+    parser.add_argument("--repeats", type=int, default=3, help="Timed runs per stage, best is kept (default: 3).")
+    parser.add_argument("--output", help="JSON file to write results to.")
+    parser.add_argument("--compare", help="JSON file of previous results to compare with.")
+    options = parser.parse_args()
+
+    #Load previous results to compare with
+    previous_results = {}
+    if options.compare is not None:
+        with open(options.compare) as file:
+            previous_results = { (r["rows"], r["stage"]): r for r in json.load(file)["results"] }
+
+
+    results = []
+    with TemporaryDirectory() as folder:
+        for rows in options.sizes:
+            #Generate synthetic measurements
+            path = join(folder, f"synthetic-{rows}.csv")
+            write_measurements(path, rows, corruption_rate=options.corruption_rate,
+                               corruption_pattern=options.corruption_pattern, gap_rate=options.gap_rate)
+            (tvec, data) = load_measurements(path, "drop", use_cache=False)
+
+            #Measure each stage
+            for stage_name, stage in create_stages(path, tvec, data):
+                (seconds, peak_bytes) = measure(stage, options.repeats)
+                result = {
+                    "rows": rows,
+                    "stage": stage_name,
+                    "seconds": seconds,
+                    "rows_per_second": rows / seconds,
+                    "peak_bytes": peak_bytes,
+                }
+
+                results.append(result)
+                print_result(result, previous_results.get((rows, stage_name)))
+
+            clear_cache(path)
+
+
+    #Write results with version information
+    if options.output is not None:
+        import pandas
+
+        report = {
+            "version": get_version(),
+            "date": datetime.now(timezone.utc).isoformat(),
+            "python": python_version(),
+            "numpy": np.__version__,
+            "pandas": pandas.__version__,
+            "options": vars(options),
+            "results": results,
+        }
+        with open(options.output, "w") as file:
+            json.dump(report, file, indent=2)
+
+
+if __name__ == "__main__":
+    main()
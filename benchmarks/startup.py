@@ -0,0 +1,73 @@
+from os.path import abspath, dirname
+from statistics import median
+from subprocess import run
+from sys import executable
+from time import perf_counter
+
+
+"""
+Benchmark of interactive startup time.
+
+Measures the time from starting Python until every module "main.py" needs to show the main menu is imported,
+with and without also importing the heavy dependencies that are now only imported when first needed
+("pandas" on first load and "matplotlib" on first plot).
+
+Run from anywhere with:
+    python benchmarks/startup.py
+"""
+
+
+#Root folder of the program
+root_folder = dirname(dirname(abspath(__file__)))
+
+#Number of times each scenario is run
+repeats = 7
+
+#Imports done by "main.py" before showing the main menu.
+#NOTE: Importing "main.py" only runs its imports, as the program itself only runs when executed directly,
+# so the measured imports always match the real startup.
+startup_imports = """
+import main
+"""
+
+#Map from scenario name to code to run
+scenarios = {
+    "Startup (lazy pandas and matplotlib)": startup_imports,
+    "Startup + eager pandas and matplotlib": startup_imports + "import pandas, matplotlib.pyplot\n",
+}
+
+#Code that fails if heavy dependencies were imported at startup
+lazy_check = startup_imports + """
+import sys
+assert "pandas" not in sys.modules, "pandas imported at startup"
+assert "matplotlib" not in sys.modules, "matplotlib imported at startup"
+"""
+
+
+
+def time_code(code):
+    """
+    Runs code in a fresh Python process and returns the wall time in seconds
+    """
+    start = perf_counter()
+    run([executable, "-c", code], cwd=root_folder, check=True)
+    return perf_counter() - start
+
+
+def main():
+    #Check heavy dependencies are not imported at startup
+    run([executable, "-c", lazy_check], cwd=root_folder, check=True)
+
+    #Time each scenario and print the median time
+    results = {}
+    for name, code in scenarios.items():
+        results[name] = median(time_code(code) for _ in range(repeats))
+        print(f"{name:<40} {results[name] * 1000:8.1f} ms")
+
+    #Print time saved before the main menu is shown
+    (lazy, eager) = results.values()
+    print(f"{'Saved at startup':<40} {(eager - lazy) * 1000:8.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,11 @@
-from lib.data import time_data_length, zone_data_length
+from lib.data import time_data_length, zone_data_length, sort_by_epochs
+from lib.epochs import (times_to_time_keys, time_keys_to_times, epochs_to_time_keys,
+                        seconds_per_minute, seconds_per_hour, seconds_per_day, time_key_seconds_per_month)
+from lib.instrument import stage
+from lib.time_index import time_range_slice
 import numpy as np
 from collections import defaultdict
+from threading import Thread
 
 
 
@@ -85,14 +90,288 @@ period_to_time_unit_reverser = {
 
 #Map from period (aggregation mode) to function that defines how zone measurements with the same time unit are aggregated
 period_to_zone_aggregator = {
-    period: (lambda zones: zones.mean(axis=0))
+    period: (lambda zones: zones.mean(axis=0, dtype=np.float64))
             if (period == "hour of the day") else 
-            (lambda zones: zones.sum(axis=0))
+            (lambda zones: zones.sum(axis=0, dtype=np.float64))
     for period in period_to_columns.keys()
 }
 
 
 
+#Map from period (aggregation mode) to the length of its groups in time keys (see "lib/epochs.py").
+#NOTE: Only defined for periods with dates, as "hour of the day" groups have no single start.
+period_to_key_seconds = {
+    "none": 1,
+    "minute": seconds_per_minute,
+    "hour": seconds_per_hour,
+    "day": seconds_per_day,
+    "month": time_key_seconds_per_month,
+}
+
+#Map from period (aggregation mode) to function that turns time keys into integer group keys.
+#Time keys keep dates as given, so groups match the time unit tuples of "select_time_unit".
+#NOTE: Capturing "key_seconds" as parameter to break closure when used in dictionary comprehension
+period_to_time_key_group = {
+    **{
+        period: (lambda key_seconds: lambda time_keys: time_keys // key_seconds)(key_seconds)
+        for period, key_seconds in period_to_key_seconds.items()
+    },
+    "hour of the day": lambda time_keys: (time_keys // seconds_per_hour) % 24,
+}
+
+#Map from period (aggregation mode) to function that turns integer group keys into time keys at the start of each group
+period_to_group_time_key = {
+    period: (lambda key_seconds: lambda keys: keys * key_seconds)(key_seconds)
+    for period, key_seconds in period_to_key_seconds.items()
+}
+
+#Map from period (aggregation mode) to function that turns integer group keys back into time vectors
+#NOTE: Inverse operation of "period_to_time_key_group", in the same way "reverse_time_unit" is for "select_time_unit".
+period_to_key_reverser = {
+    **{
+        period: (lambda group_time_key: lambda keys: time_keys_to_times(group_time_key(keys)))(group_time_key)
+        for period, group_time_key in period_to_group_time_key.items()
+    },
+    "hour of the day": lambda keys: reverse_time_units(keys, period_to_columns["hour of the day"][0]),
+}
+
+#Map from period (aggregation mode) to the finer period it is rolled up from.
+#"None" means the period is rolled up directly from the measurements.
+period_to_rollup_source = {
+    "none": None,
+    "minute": "none",
+    "hour": "minute",
+    "day": "hour",
+    "month": "day",
+    "hour of the day": "hour",
+}
+
+
+
+def reverse_time_units(time_units, column):
+    """
+    Turns an array of single column time units into time vectors, with all other columns zeroed.
+    Bulk version of "reverse_time_unit" for single column time units.
+    """
+    times = np.zeros((len(time_units), time_data_length), dtype=np.int64)
+    times[:, column] = time_units
+
+    return times
+
+
+def group_sum_by_keys(keys, zones, counts=None):
+    """
+    Sums all zone measurements with the same integer group key together.
+    Returns a tuple "(group_keys, group_sums, group_counts)" sorted by group key.
+    
+    "counts" optionally gives the number of measurements each row of "zones" is a sum of.
+    If not given, each row is one measurement.
+
+    Measurements are summed in their original order within each group.
+    """
+    if counts is None:
+        counts = np.ones(len(keys), dtype=np.int64)
+
+    #Sort by key once, unless keys are already sorted (usual for measurements)
+    with stage("aggregate.sort", len(keys)):
+        (keys, zones, counts) = sort_by_epochs(keys, zones, counts)
+
+    with stage("aggregate.group", len(keys)):
+        #Find the start of each group
+        starts = np.flatnonzero(np.concatenate(([True], keys[1:] != keys[:-1])))
+
+        #If every group is a single row, there is nothing to sum
+        #NOTE: Copying, as the arrays may be the caller's (e.g. read-only cached or raw data)
+        if len(starts) == len(keys):
+            return (keys.copy(), zones.astype(np.float64), counts.copy())
+
+        #Sum and count each group
+        #NOTE: Summing in float64 keeps sums accurate for compact float32 zones
+        group_sums = np.add.reduceat(zones, starts, axis=0, dtype=np.float64)
+        group_counts = np.add.reduceat(counts, starts)
+
+    return (keys[starts], group_sums, group_counts)
+
+
+def aggregate_groups(group_keys, group_sums, group_counts, period):
+    """
+    Turns summed groups into aggregated data in the same format as "aggregate_measurements".
+    """
+    #If aggregation mode is "hour of the day", take the mean of every hour of the day.
+    # Hours without measurements get "zero zone measurements".
+    if period == "hour of the day":
+        hour_sums = np.zeros((24, group_sums.shape[1]))
+        hour_counts = np.zeros(24, dtype=np.int64)
+        hour_sums[group_keys] = group_sums
+        hour_counts[group_keys] = group_counts
+
+        (group_keys, group_sums) = (np.arange(24), hour_sums / np.maximum(hour_counts, 1)[:, None])
+
+
+    #Rebuild time vectors from group keys
+    return (period_to_key_reverser[period](group_keys), group_sums)
+
+
+def aggregate_time_keys(time_keys, zones, period):
+    """
+    Aggregates zone measurements with times given as time keys (see "lib/epochs.py").
+    Returns aggregated data in the same format as "aggregate_measurements",
+    but sorted by time.
+
+    Groups are found with array operations on integer group keys instead of Python dictionaries.
+    """
+    #If empty, return empty aggregated data
+    if len(time_keys) == 0:
+        return (np.empty((0, time_data_length), dtype=np.int64), zones[:0])
+
+
+    #Sum zone measurements by period and aggregate
+    keys = period_to_time_key_group[period](time_keys)
+    return aggregate_groups(*group_sum_by_keys(keys, zones), period)
+
+
+
+def rollup_level(period, time_keys, zones, levels, counts=None):
+    """
+    Returns the roll-up level of a period as a tuple "(group_keys, group_sums, group_counts)".
+    "counts" optionally gives the number of measurements each row of "zones" counts as, see "group_sum_by_keys".
+    
+    Each level is summed from the finer level in "period_to_rollup_source",
+    so coarser levels cost work in proportion to the level below instead of the number of measurements.
+    "levels" is a dictionary of already computed levels, and computed levels are added to it.
+
+    REMARK: Assumes "time_keys" is not empty.
+    REMARK: Float sums can differ from "aggregate_time_keys" in the last bits, as the summation order differs.
+    """
+    #If already computed, reuse level
+    if period in levels:
+        return levels[period]
+
+    source = period_to_rollup_source[period]
+
+    #If there is no finer level, sum measurements directly
+    if source is None:
+        level = group_sum_by_keys(period_to_time_key_group[period](time_keys), zones, counts)
+    #Else, sum groups of the finer level by the start of each group
+    else:
+        (source_keys, source_sums, source_counts) = rollup_level(source, time_keys, zones, levels, counts)
+        source_time_keys = period_to_group_time_key[source](source_keys)
+        level = group_sum_by_keys(period_to_time_key_group[period](source_time_keys), source_sums, source_counts)
+
+    #Store level for coarser levels and later aggregations
+    levels[period] = level
+
+    return level
+
+
+def build_rollup(time_keys, zones, counts=None):
+    """
+    Builds the roll-up levels of all periods and returns them as a dictionary from period to level.
+    See "rollup_level".
+    """
+    levels = {}
+    for period in period_to_rollup_source:
+        rollup_level(period, time_keys, zones, levels, counts)
+
+    return levels
+
+
+def merge_rollup_level(level, delta_level):
+    """
+    Adds the group partials of "delta_level" to a roll-up level and returns the merged level.
+    Groups with no measurements left after merging are removed.
+    """
+    merged_level = group_sum_by_keys(*(np.concatenate(arrays) for arrays in zip(level, delta_level)))
+
+    #Remove groups whose measurements have all been subtracted
+    (group_keys, group_sums, group_counts) = merged_level
+    keep = group_counts != 0
+
+    return (group_keys[keep], group_sums[keep], group_counts[keep])
+
+
+def update_rollup(levels, added_time_keys, added_zones, removed_time_keys, removed_zones):
+    """
+    Updates already computed roll-up levels with added and removed measurements,
+    by adding the group partials of the changed measurements instead of recomputing the levels.
+    Returns a new dictionary of updated levels.
+
+    REMARK: Removed measurements must be part of the measurements the levels were computed from.
+    """
+    #Removed measurements are subtracted by counting them negatively
+    delta_time_keys = np.concatenate((removed_time_keys, added_time_keys))
+    delta_zones = np.concatenate((-removed_zones, added_zones))
+    delta_counts = np.concatenate((np.full(len(removed_time_keys), -1, dtype=np.int64),
+                                   np.ones(len(added_time_keys), dtype=np.int64)))
+
+    #If nothing changed, levels stay the same
+    if len(delta_time_keys) == 0:
+        return dict(levels)
+
+    #Roll up the changed measurements and merge them into each computed level
+    delta_levels = {}
+    #NOTE: Iterating a snapshot of the levels, as levels may be added to "levels" while updating
+    return {
+        period: merge_rollup_level(level, rollup_level(period, delta_time_keys, delta_zones, delta_levels, delta_counts))
+        for period, level in list(levels.items())
+    }
+
+
+def aggregate_rollup(time_keys, zones, period, levels):
+    """
+    Aggregates zone measurements with times given as time keys like "aggregate_time_keys",
+    but via roll-up levels stored in and reused from "levels". See "rollup_level".
+    """
+    #If empty, return empty aggregated data
+    if len(time_keys) == 0:
+        return aggregate_time_keys(time_keys, zones, period)
+
+    return aggregate_groups(*rollup_level(period, time_keys, zones, levels), period)
+
+
+def first_group_key_from(period, epoch):
+    """
+    Returns the group key of the first group of a period starting at or after "epoch" (seconds since epoch).
+    """
+    time_key = epochs_to_time_keys([epoch])[0]
+    key = period_to_time_key_group[period](time_key)
+
+    #If the group containing "epoch" starts before it, the next group is the first
+    if period_to_group_time_key[period](key) < time_key:
+        key += 1
+
+    return key
+
+
+def query_rollup(time_keys, zones, period, levels, start=None, end=None):
+    """
+    Aggregates zone measurements like "aggregate_rollup",
+    but only returns the groups starting within the time range [start, end) (seconds since epoch).
+    "None" leaves the range unbounded on that side.
+
+    Groups are found with binary search on the sorted group keys of the roll-up level (see "time_range_slice"),
+    so once a level is computed, only the returned groups are touched.
+
+    Raises a "ValueError" for "hour of the day", as its groups have no start time.
+    """
+    if period not in period_to_group_time_key:
+        raise ValueError(f"Aggregation mode {period} cannot be restricted to a time range")
+
+    #If empty, return empty aggregated data
+    if len(time_keys) == 0:
+        return aggregate_time_keys(time_keys, zones, period)
+
+
+    #Find groups starting within the time range
+    (group_keys, group_sums, group_counts) = rollup_level(period, time_keys, zones, levels)
+    rows = time_range_slice(group_keys,
+                            None if start is None else first_group_key_from(period, start),
+                            None if end is None else first_group_key_from(period, end))
+
+    return aggregate_groups(group_keys[rows], group_sums[rows], group_counts[rows], period)
+
+
+
 def group_by_time_units(times, zones, time_unit_selector):
     """
     Group all measurements with the same time unit together.
@@ -135,10 +414,14 @@ def add_zero_hour_measurements(grouped_zones, tu_selector):
 
 
 
-def aggregate_measurements(tvec, data, period):
+def aggregate_measurements(tvec, data, period, vectorized=True):
     """
     Aggregates zone measurements based on time periods by summing usage.
     If period is "hour of the day" aggregation is done via a mean of the usage instead of summing.
+    
+    If "vectorized" is true, aggregation is done with "aggregate_time_keys", and results are sorted by time.
+    Else, measurements are grouped one at a time with Python dictionaries, 
+    which is slower but useful for checking results.
 
     REMARK: Assumes "period" parameter is one of:
         "none"
@@ -153,6 +436,10 @@ def aggregate_measurements(tvec, data, period):
     if (len(tvec) == 0):
         return (tvec, data)
 
+    #If vectorized, aggregate with integer group keys
+    if vectorized:
+        return aggregate_time_keys(times_to_time_keys(tvec), data, period)
+
 
     #Retrieve time unit selector and reverser for the given period (aggregation mode)
     tu_selector = period_to_time_unit_selector[period]
@@ -163,7 +450,8 @@ def aggregate_measurements(tvec, data, period):
 
 
     #Group zones measurements by period
-    grouped_zones = group_by_time_units(tvec, data, tu_selector)
+    with stage("aggregate.group", len(tvec)):
+        grouped_zones = group_by_time_units(tvec, data, tu_selector)
 
     #If aggregation mode is "hour of the day", pad empty hours with "zero zone measurements"
     if (period == "hour of the day"):
@@ -196,22 +484,50 @@ def aggregate_measurements(tvec, data, period):
 def aggregate_sort_data(state):
     """
     Aggregate and sort raw data in program state and store the result in program state.
+    Aggregated data is reused from the program state cache if available.
     Prints out status messages too.
     """
 
+    #If already aggregated, reuse cached aggregated data
+    cached_data = state.get_cached_aggregation(state.aggregation_mode)
+    if cached_data is not None:
+        state.aggregated_data = cached_data
+        print("Aggregated data", end="\n\n")
+        return
+
+
     #Start aggregating data
+    #NOTE: Aggregating directly from the compact raw times, which also sorts the aggregated data
     print("Aggregating data...")
-    state.aggregated_data = aggregate_measurements(*state.raw_data, state.aggregation_mode)
-
-    #Sort data if there is data
-    (times, zones) = state.aggregated_data
-    if len(times) > 0:
-        #Get sorted indexes with seconds as primary sort key
-        sorted_indexes = np.lexsort(times.T[::-1])
-        
-        #Access data in sorted order and save
-        state.aggregated_data = (times[sorted_indexes], zones[sorted_indexes])
+    (raw_version, time_keys, zones, levels) = state.get_raw_snapshot()
+    state.aggregated_data = aggregate_rollup(time_keys, zones, state.aggregation_mode, levels)
+    state.cache_aggregation(state.aggregation_mode, state.aggregated_data, raw_version)
+    state.store_rollup_levels(levels, raw_version)
 
 
     #Aggregated data
     print("Aggregated data", end="\n\n")
+
+
+def warm_aggregation_cache(state):
+    """
+    Aggregates raw data in program state for all periods not yet cached, in a background thread.
+    Results are stored in the program state cache, unless the raw data changes in the meantime.
+    Periods are aggregated from finest to coarsest, so each roll-up level is built from the level below.
+    
+    Returns the started thread.
+    """
+    (raw_version, time_keys, zones, levels) = state.get_raw_snapshot()
+
+    def warm():
+        for period in period_to_rollup_source:
+            if state.get_cached_aggregation(period) is None:
+                aggregated_data = aggregate_rollup(time_keys, zones, period, levels)
+                state.cache_aggregation(period, aggregated_data, raw_version)
+                state.store_rollup_levels(levels, raw_version)
+
+    #NOTE: Daemon thread so it never keeps the program from quitting
+    thread = Thread(target=warm, daemon=True)
+    thread.start()
+
+    return thread
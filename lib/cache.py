@@ -0,0 +1,195 @@
+from lib.utilities import eprint
+
+import numpy as np
+from hashlib import sha1
+from os import getpid, listdir, makedirs, remove, replace, stat, utime
+from os.path import abspath, dirname, exists, join
+
+
+#Name of the cache folder created next to cached source files
+cache_folder_name = ".measurement_cache"
+
+#Maximum total size of a cache folder in bytes before least recently used entries are evicted
+cache_max_bytes = 512 * 1024 ** 2
+
+#File name suffixes of the arrays stored for each cache entry: times, zones, and the fill mode used
+cache_array_suffixes = (".times.npy", ".zones.npy", ".fmode.npy")
+
+#File name suffix of arrays being written, which are never invalidated or evicted by other processes
+cache_temp_suffix = ".tmp"
+
+
+
+def hash_text(text):
+    """
+    Returns a short hexadecimal hash of a string
+    """
+    return sha1(text.encode("utf-8")).hexdigest()[:16]
+
+
+def get_cache_folder(filename):
+    """
+    Returns the cache folder for a source file
+    """
+    return join(dirname(abspath(filename)), cache_folder_name)
+
+
+def get_cache_entry(filename, options):
+    """
+    Returns a tuple "(source_key, version_key, entry)" identifying the cache entry for a source file.
+
+    Entries are named "<source_key>-<version_key>-<options_key>", where
+    "source_key" only depends on the path of the source file,
+    "version_key" on the size and modification time of the source file, and "options_key" on the load "options".
+    So changing the source file leads to a different version, and each version has one entry per load options.
+    """
+    path = abspath(filename)
+    file_stat = stat(path)
+
+    source_key = hash_text(path)
+    version_key = hash_text(f"{file_stat.st_size}|{file_stat.st_mtime_ns}")
+    options_key = hash_text(repr(options))
+
+    return (source_key, version_key, f"{source_key}-{version_key}-{options_key}")
+
+
+def get_entry_paths(folder, entry):
+    """
+    Returns the paths of the array files of a cache entry
+    """
+    return [join(folder, entry + suffix) for suffix in cache_array_suffixes]
+
+
+def get_file_entry(name):
+    """
+    Returns the name of the cache entry a cache file belongs to, or None if it is not an array file of an entry
+    """
+    for suffix in cache_array_suffixes:
+        if name.endswith(suffix):
+            return name[:-len(suffix)]
+    return None
+
+
+
+def list_cache_files(folder):
+    """
+    Returns the names of the files of complete cache entries in a cache folder, leaving out files being written
+    """
+    return [name for name in listdir(folder) if not name.endswith(cache_temp_suffix)]
+
+
+def remove_cache_file(path):
+    """
+    Removes a cache file unless another process already removed it
+    """
+    try:
+        remove(path)
+    except FileNotFoundError:
+        pass
+
+
+def load_cached_measurements(filename, options):
+    """
+    Returns measurements "(tvec, data, fmode)" cached for a source file and load "options" as memory-mapped arrays,
+    where "fmode" is the fill mode that was used to normalize them.
+    Returns None if there is no valid cache entry.
+
+    REMARK: The returned arrays are read-only.
+    """
+    try:
+        folder = get_cache_folder(filename)
+        (_, _, entry) = get_cache_entry(filename, options)
+        paths = get_entry_paths(folder, entry)
+
+        #Memory-map arrays instead of reading them
+        measurements = tuple(np.load(path, mmap_mode="r") for path in paths)
+
+        #Mark entry as recently used for eviction
+        for path in paths:
+            utime(path)
+
+        return measurements
+    #Entry does not exist or is unreadable
+    except (OSError, ValueError):
+        return None
+
+
+def store_cached_measurements(filename, options, measurements, max_bytes=cache_max_bytes):
+    """
+    Stores measurements "(tvec, data, fmode)" in the cache for a source file and load "options",
+    where "fmode" is the fill mode that was used to normalize them, stored as a 0-dimensional string array.
+    Entries of outdated versions of the same source file are removed, while entries of the current version
+    with other load options are kept. Least recently used entries are evicted if the cache folder grows larger
+    than "max_bytes", and measurements larger than "max_bytes" are not stored at all.
+
+    Failing to write the cache only prints a warning.
+    """
+    #If the entry alone would exceed the size bound, it would be evicted right away
+    if sum(np.asarray(array).nbytes for array in measurements) > max_bytes:
+        return
+
+    try:
+        folder = get_cache_folder(filename)
+        (source_key, version_key, entry) = get_cache_entry(filename, options)
+        makedirs(folder, exist_ok=True)
+
+        #Invalidate entries of other versions of the same source file
+        for name in list_cache_files(folder):
+            if name.startswith(f"{source_key}-") and not name.startswith(f"{source_key}-{version_key}-"):
+                remove_cache_file(join(folder, name))
+
+        #Write each array to a temporary file and then move it into place,
+        # so other loads never see partially written entries.
+        #NOTE: Temporary files are named per process, as files may be loaded in parallel processes
+        for path, array in zip(get_entry_paths(folder, entry), measurements):
+            temp_path = f"{path}.{getpid()}{cache_temp_suffix}"
+            with open(temp_path, "wb") as file:
+                np.save(file, np.ascontiguousarray(array))
+            replace(temp_path, path)
+
+        #Keep cache within its size bound
+        evict_cache(folder, max_bytes)
+    except OSError as e:
+        eprint(f"Could not write measurement cache for {filename}: {e}")
+
+
+def evict_cache(folder, max_bytes=cache_max_bytes):
+    """
+    Removes least recently used entries from a cache folder until its total size is at most "max_bytes".
+    Entries are removed whole, with all of their array files, and their last use is that of their newest file.
+    Files being written, or removed by other processes in the meantime, are skipped.
+    """
+    #Get total size, last use and files of each entry in the cache folder
+    entries = {}
+    for name in list_cache_files(folder):
+        (entry, path) = (get_file_entry(name), join(folder, name))
+        if entry is None:
+            continue
+
+        try:
+            file_stat = stat(path)
+        except FileNotFoundError:
+            continue
+
+        (size, last_used, paths) = entries.get(entry, (0, 0, []))
+        entries[entry] = (size + file_stat.st_size, max(last_used, file_stat.st_mtime_ns), paths + [path])
+
+    total_bytes = sum(size for size, _, _ in entries.values())
+
+    #Remove least recently used entries first
+    for size, _, paths in sorted(entries.values(), key=lambda entry: entry[1]):
+        if total_bytes <= max_bytes:
+            break
+
+        for path in paths:
+            remove_cache_file(path)
+        total_bytes -= size
+
+
+def clear_cache(filename):
+    """
+    Removes all cache entries in the cache folder of a source file
+    """
+    folder = get_cache_folder(filename)
+    if exists(folder):
+        evict_cache(folder, 0)
@@ -0,0 +1,283 @@
+from lib.data import fmodes, file_exists, expand_paths, load_measurements, load_many_measurements, stream_measurements
+from lib.columnar import (is_columnar_path, load_columnar_measurements, save_measurements, get_columnar_format,
+                          import_pyarrow_io)
+from lib.aggregate import aggregate_rollup, period_to_columns, period_to_status
+from lib.epochs import times_to_time_keys
+from lib.statistics import (print_statistics, print_grouped_statistics, print_streaming_statistics, grouping_to_key,
+                            dated_groupings)
+from lib.export import export_plots, export_formats, default_measurement_unit_status
+from lib.instrument import enable_instrumentation, get_recent_stages, format_stage
+from lib.time_index import dates_to_epochs, restrict_measurements
+from lib.utilities import eprint
+from lib.data_fill_processors import time_data_length, zone_data_length
+
+import numpy as np
+from argparse import ArgumentParser
+
+
+"""
+Non-interactive command-line pipeline.
+
+Runs load -> aggregate -> statistics -> export without any prompts, e.g.:
+    python main.py --input "data/*.csv" --fmode forward-fill --period day --stats --export plots
+Statistics of files larger than memory can be streamed instead, e.g.:
+    python main.py --input "data/*.csv" --stream
+
+Names with spaces (fill modes, periods and groupings) are written with dashes on the command line.
+Dates are written as YYYYMMDD numbers.
+"""
+
+
+
+def to_cli_name(name):
+    """
+    Turns a name with spaces into a command-line friendly name with dashes
+    """
+    return name.replace(" ", "-")
+
+def from_cli_name(cli_name):
+    """
+    Turns a command-line friendly name with dashes back into a name with spaces.
+    Inverse operation of "to_cli_name".
+    """
+    return cli_name.replace("-", " ")
+
+
+def create_parser():
+    """
+    Creates the command-line argument parser of the pipeline
+    """
+    parser = ArgumentParser(description="Load, aggregate, summarize and plot household electricity measurements.")
+
+    parser.add_argument("--input", nargs="+", required=True,
+                        help="Measurement files or glob patterns. Multiple files are loaded in parallel. " +
+                             "A single .parquet or .arrow file or NumPy folder saved with --save-raw is loaded directly.")
+    parser.add_argument("--fmode", default="drop", choices=[to_cli_name(fmode) for fmode in fmodes],
+                        help="How to handle corrupted measurements (default: drop).")
+    parser.add_argument("--fill-per-zone", action="store_true",
+                        help="Fill each corrupted zone from its own nearest valid measurement.")
+    parser.add_argument("--start", type=int,
+                        help="Only use measurements from this date (YYYYMMDD, inclusive).")
+    parser.add_argument("--end", type=int,
+                        help="Only use measurements before this date (YYYYMMDD, exclusive).")
+    parser.add_argument("--period", default="minute", choices=[to_cli_name(period) for period in period_to_columns],
+                        help="Aggregation mode for statistics (default: minute).")
+    parser.add_argument("--stats", action="store_true",
+                        help="Print quartile statistics of the aggregated data.")
+    parser.add_argument("--group-stats", choices=[to_cli_name(grouping) for grouping in grouping_to_key],
+                        help="Print quartile statistics of the aggregated data grouped by time.")
+    parser.add_argument("--stream", action="store_true",
+                        help="Only print approximate quartile statistics of the raw measurements, " +
+                             "streaming the input files in chunks instead of loading them into memory.")
+    parser.add_argument("--save-raw",
+                        help="Save the loaded measurements to a .parquet or .arrow file, or else a folder of NumPy files.")
+    parser.add_argument("--save-aggregated",
+                        help="Save the measurements aggregated by --period like --save-raw.")
+    parser.add_argument("--export",
+                        help="Directory to save zone and combined plots to.")
+    parser.add_argument("--export-periods", nargs="+", choices=[to_cli_name(period) for period in period_to_columns],
+                        help="Aggregation modes to export plots of (default: --period).")
+    parser.add_argument("--formats", nargs="+", default=["png"], choices=export_formats,
+                        help="File formats of exported plots (default: png).")
+    parser.add_argument("--processes", type=int,
+                        help="Number of worker processes for loading and exporting (default: CPU cores).")
+    parser.add_argument("--no-cache", action="store_true",
+                        help="Always parse measurement files instead of using the binary cache.")
+    parser.add_argument("--compact", action="store_true",
+                        help="Store measurements as float32 zones and int16 times to halve memory. Sums are still float64.")
+    parser.add_argument("--trace",
+                        help="Record time, rows and memory of each pipeline stage, and append them as JSON lines to this file.")
+
+    return parser
+
+
+
+def load_files(inputs, fmode, fill_per_zone, use_cache, processes, compact=False):
+    """
+    Loads measurements from measurement files or glob patterns and returns a tuple "(tvec, data, errors)".
+    A single file is loaded directly, while multiple files or glob patterns are loaded in parallel.
+    Inputs that match no files are reported as errors.
+    """
+    #Report inputs without any files
+    missing_errors = [(path, FileNotFoundError("No files found")) for path in inputs if len(expand_paths(path)) == 0]
+    for path, error in missing_errors:
+        eprint(f"Could not load {path}: {error}")
+
+    #If a single file, skip starting worker processes, but report errors like for multiple files
+    if len(inputs) == 1 and file_exists(inputs[0]):
+        try:
+            return (*load_measurements(inputs[0], fmode, fill_per_zone=fill_per_zone, use_cache=use_cache,
+                                       compact=compact), [])
+        except Exception as e:
+            eprint(f"Could not load {inputs[0]}: {e}")
+            return (np.empty((0, time_data_length)), np.empty((0, zone_data_length)), [(inputs[0], e)])
+    #Else, load all files in parallel
+    else:
+        (tvec, data, errors) = load_many_measurements(inputs, fmode, processes=processes,
+                                                      fill_per_zone=fill_per_zone, use_cache=use_cache,
+                                                      compact=compact)
+        return (tvec, data, missing_errors + errors)
+
+
+def load_inputs(inputs, fmode, fill_per_zone, use_cache, processes, compact=False, time_range=(None, None)):
+    """
+    Loads measurements from the input paths and returns a tuple "(tvec, data, errors)".
+    A single input of saved columnar measurements is loaded directly, else see "load_files".
+    
+    Measurements are restricted to the time range "(start, end)" of seconds since epoch.
+    Saved columnar measurements only load measurements within the time range.
+    """
+    #If saved columnar measurements, load them directly
+    if len(inputs) == 1 and is_columnar_path(inputs[0]):
+        return (*load_columnar_measurements(inputs[0], start=time_range[0], end=time_range[1]), [])
+
+    (tvec, data, errors) = load_files(inputs, fmode, fill_per_zone, use_cache, processes, compact)
+
+    #If a time range is given, restrict measurements to it
+    if time_range != (None, None):
+        (tvec, data) = restrict_measurements(tvec, data, *time_range)
+
+    return (tvec, data, errors)
+
+
+def stream_statistics(inputs, fmode, fill_per_zone, time_range=(None, None)):
+    """
+    Prints approximate statistics of the raw measurements in measurement files or glob patterns,
+    streaming one file at a time in chunks (see "stream_measurements" and "print_streaming_statistics").
+    Measurements are restricted to the time range "(start, end)" of seconds since epoch.
+    
+    Returns a tuple "(rows, errors)" of the number of measurements and a list of "(path, error)" of inputs
+    that could not be loaded. Measurements streamed from a file before it failed are still included.
+    """
+    #Report inputs without any files
+    errors = [(path, FileNotFoundError("No files found")) for path in inputs if len(expand_paths(path)) == 0]
+    for path, error in errors:
+        eprint(f"Could not load {path}: {error}")
+
+    rows = 0
+
+    def blocks():
+        nonlocal rows
+        for path in expand_paths(inputs):
+            try:
+                for (tvec, data) in stream_measurements(path, fmode, fill_per_zone=fill_per_zone):
+                    #If a time range is given, restrict each block to it
+                    if time_range != (None, None):
+                        (tvec, data) = restrict_measurements(tvec, data, *time_range)
+
+                    rows += len(tvec)
+                    yield (tvec, data)
+            except Exception as e:
+                eprint(f"Could not load {path}: {e}")
+                errors.append((path, e))
+
+    print_streaming_statistics(blocks())
+    return (rows, errors)
+
+
+def run_pipeline(args):
+    """
+    Runs the non-interactive pipeline with the given command-line arguments (excluding the program name).
+    Returns the exit code: 0 on success, 1 if any input could not be loaded or no data was loaded.
+    """
+    parser = create_parser()
+    options = parser.parse_args(args)
+    (fmode, period) = (from_cli_name(options.fmode), from_cli_name(options.period))
+
+    #Convert dates of the time range to seconds since epoch
+    try:
+        time_range = tuple(None if date is None else dates_to_epochs([date])[0] for date in (options.start, options.end))
+    except ValueError as e:
+        parser.error(str(e))
+
+    #Times aggregated by "hour of the day" have no dates to group by
+    grouping = None if options.group_stats is None else from_cli_name(options.group_stats)
+    if period == "hour of the day" and grouping in dated_groupings:
+        parser.error(f"--group-stats {options.group_stats} cannot be used with --period {options.period}")
+
+    #Streamed statistics are printed instead of the other outputs, as measurements are never all loaded
+    if options.stream and (options.stats or options.group_stats is not None or options.export is not None or
+                           options.save_raw is not None or options.save_aggregated is not None):
+        parser.error("--stream cannot be used with --stats, --group-stats, --save-raw, --save-aggregated or --export")
+
+    #Saving Parquet or Arrow files requires pyarrow, so check it is installed before loading anything
+    for save_path in (options.save_raw, options.save_aggregated):
+        if save_path is not None and get_columnar_format(save_path) != "numpy":
+            try:
+                import_pyarrow_io(get_columnar_format(save_path))
+            except ImportError as e:
+                eprint(e)
+                return 1
+
+    #If tracing, record pipeline stages
+    if options.trace is not None:
+        enable_instrumentation(options.trace)
+
+
+    #If streaming, print statistics of the raw measurements without loading them
+    if options.stream:
+        (rows, errors) = stream_statistics(options.input, fmode, options.fill_per_zone, time_range)
+        if rows == 0:
+            return 1
+
+        print(f"Streamed {rows} measurements")
+        print(default_measurement_unit_status)
+        return 1 if len(errors) > 0 else 0
+
+
+    #Load measurements
+    (tvec, data, errors) = load_inputs(options.input, fmode, options.fill_per_zone,
+                                       not options.no_cache, options.processes, options.compact, time_range)
+
+    #If no data, there is nothing more to do
+    if len(tvec) == 0:
+        eprint("No data loaded")
+        return 1
+
+    print(f"Loaded {len(tvec)} measurements")
+
+
+    #If requested, save loaded measurements
+    if options.save_raw is not None:
+        save_measurements(options.save_raw, tvec, data)
+        print(f"Saved measurements to {options.save_raw}")
+
+
+    #If statistics or aggregated measurements are requested, aggregate
+    if options.stats or options.group_stats is not None or options.save_aggregated is not None:
+        aggregated_data = aggregate_rollup(times_to_time_keys(tvec), data, period, {})
+
+        if options.save_aggregated is not None:
+            save_measurements(options.save_aggregated, *aggregated_data)
+            print(f"Saved aggregated measurements to {options.save_aggregated}")
+
+    #If statistics are requested, print them
+    if options.stats or options.group_stats is not None:
+        if options.stats:
+            print_statistics(*aggregated_data)
+        if options.group_stats is not None:
+            print_grouped_statistics(*aggregated_data, from_cli_name(options.group_stats))
+
+        #Print aggregation mode and measurement unit
+        print(period_to_status[period])
+        print(default_measurement_unit_status)
+
+
+    #If plots are requested, render and save them
+    if options.export is not None:
+        export_periods = [from_cli_name(p) for p in (options.export_periods or [options.period])]
+        saved_paths = export_plots(tvec, data, export_periods, options.export, options.formats,
+                                   processes=options.processes)
+
+        print(f"Exported {len(saved_paths)} plots to {options.export}")
+
+
+    #If tracing, summarize the most recent stages
+    if options.trace is not None:
+        print(f"Last stages (full trace in {options.trace}):")
+        for record in get_recent_stages():
+            print(f"  {format_stage(record)}")
+
+
+    #Fail if any input could not be loaded
+    return 1 if len(errors) > 0 else 0
@@ -0,0 +1,224 @@
+from lib.data_fill_processors import time_data_length, zone_data_length
+from lib.data import sort_by_epochs
+from lib.epochs import times_to_epochs, has_dates
+from lib.time_index import time_range_slice
+
+import numpy as np
+from os import makedirs, remove
+from os.path import exists, isdir, join, splitext
+
+
+"""
+Columnar storage of raw and aggregated measurements.
+
+Measurements "(tvec, data)" are stored column by column, so readers can load only the columns they need:
+    "epoch": Seconds since epoch, only stored for times with dates (not for "hour of the day")
+    "year", "month", "day", "hour", "minute", "second": Time columns
+    "zone1", ..., "zone4": Zone columns
+
+The format is chosen by the path:
+    ".parquet": Apache Parquet file in row groups with time statistics (requires "pyarrow")
+    ".arrow": Uncompressed Arrow IPC file, which is memory-mapped when read (requires "pyarrow")
+    Any other path: Folder with a NumPy ".npy" file per column, which is memory-mapped when read
+
+Measurements are stored sorted by time, so time ranges can be found with binary search,
+and Parquet row groups outside a time range are skipped entirely.
+"""
+
+
+#Names of the stored columns
+epoch_column_name = "epoch"
+time_column_names = ["year", "month", "day", "hour", "minute", "second"]
+zone_column_names = [f"zone{z + 1}" for z in range(zone_data_length)]
+
+#Number of rows per Parquet row group and Arrow record batch.
+#Smaller groups allow skipping more rows when filtering by time, but compress worse.
+columnar_row_group_size = 100_000
+
+#File name suffixes of the formats requiring "pyarrow"
+pyarrow_suffixes = [".parquet", ".arrow"]
+
+
+
+def import_pyarrow_io(suffix):
+    """
+    Imports and returns the "pyarrow" module with its Parquet and Arrow IPC readers and writers.
+    Raises an "ImportError" naming the file format if pyarrow is not installed.
+    """
+    try:
+        import pyarrow
+        import pyarrow.feather
+        import pyarrow.ipc
+        import pyarrow.parquet
+        return pyarrow
+    except ImportError:
+        raise ImportError(f"Reading and writing {suffix} files requires pyarrow. " +
+                          "Install it, or save to a folder of NumPy files instead")
+
+
+def get_columnar_format(path):
+    """
+    Returns the storage format of a path: ".parquet", ".arrow", or "numpy"
+    """
+    suffix = splitext(path)[1].lower()
+    return suffix if suffix in pyarrow_suffixes else "numpy"
+
+
+def is_columnar_path(path):
+    """
+    Returns whether a path leads to stored columnar measurements
+    """
+    #If a Parquet or Arrow file, check the file exists
+    if get_columnar_format(path) != "numpy":
+        return exists(path) and not isdir(path)
+    #Else, check the folder has NumPy time columns
+    else:
+        return isdir(path) and exists(join(path, f"{time_column_names[0]}.npy"))
+
+
+def measurements_to_columns(tvec, data):
+    """
+    Turns measurements into a dictionary from column name to column, sorted by time.
+    """
+    columns = {}
+
+    #If times have dates, store seconds since epoch and sort by them
+    if has_dates(tvec):
+        (epochs, tvec, data) = sort_by_epochs(times_to_epochs(tvec), tvec, data)
+        columns[epoch_column_name] = epochs
+
+    #Store each time unit and zone in its own column
+    columns.update({ name: tvec[:, c] for c, name in enumerate(time_column_names) })
+    columns.update({ name: data[:, c] for c, name in enumerate(zone_column_names) })
+
+    return columns
+
+
+def save_measurements(path, tvec, data, row_group_size=columnar_row_group_size):
+    """
+    Saves measurements "(tvec, data)" in the columnar format chosen by "path", see "get_columnar_format".
+    Works for both raw and aggregated measurements, and keeps the types of the arrays (e.g. compact types).
+    An existing file or folder of columns is replaced.
+    """
+    columns = measurements_to_columns(tvec, data)
+    storage_format = get_columnar_format(path)
+
+    #If NumPy, save each column to its own file
+    if storage_format == "numpy":
+        makedirs(path, exist_ok=True)
+        for name, column in columns.items():
+            np.save(join(path, f"{name}.npy"), np.ascontiguousarray(column))
+
+        #Remove seconds since epoch of previously saved measurements with dates
+        epoch_path = join(path, f"{epoch_column_name}.npy")
+        if epoch_column_name not in columns and exists(epoch_path):
+            remove(epoch_path)
+
+        return
+
+
+    #Else, save as a table with pyarrow
+    pyarrow = import_pyarrow_io(storage_format)
+    table = pyarrow.table({ name: np.ascontiguousarray(column) for name, column in columns.items() })
+
+    if storage_format == ".parquet":
+        pyarrow.parquet.write_table(table, path, row_group_size=row_group_size)
+    else:
+        #NOTE: Uncompressed, so the file can be memory-mapped without decompressing
+        pyarrow.feather.write_feather(table, path, compression="uncompressed", chunksize=row_group_size)
+
+
+
+def load_stored_columns(path, names, start=None, end=None):
+    """
+    Loads the columns "names" of stored columnar measurements within the time range [start, end),
+    and returns them as a dictionary from column name to column.
+
+    REMARK: Assumes the seconds since epoch column exists if the time range is bounded.
+    """
+    storage_format = get_columnar_format(path)
+    filtered = start is not None or end is not None
+
+    #If NumPy, memory-map only the needed columns and slice them
+    if storage_format == "numpy":
+        columns = { name: np.load(join(path, f"{name}.npy"), mmap_mode="r") for name in names }
+
+        if filtered:
+            rows = time_range_slice(np.load(join(path, f"{epoch_column_name}.npy"), mmap_mode="r"), start, end)
+            columns = { name: column[rows] for name, column in columns.items() }
+
+        return columns
+
+
+    pyarrow = import_pyarrow_io(storage_format)
+
+    #If Parquet, read only the needed columns of row groups within the time range
+    if storage_format == ".parquet":
+        filters = []
+        if start is not None:
+            filters.append((epoch_column_name, ">=", start))
+        if end is not None:
+            filters.append((epoch_column_name, "<", end))
+
+        table = pyarrow.parquet.read_table(path, columns=names, filters=filters if filtered else None)
+    #Else, memory-map the Arrow file and slice the needed columns
+    else:
+        table = pyarrow.feather.read_table(path, columns=names + ([epoch_column_name] if filtered else []),
+                                           memory_map=True)
+
+        if filtered:
+            rows = time_range_slice(table.column(epoch_column_name).to_numpy(), start, end)
+            table = table.slice(rows.start, rows.stop - rows.start)
+
+    return { name: table.column(name).to_numpy() for name in names }
+
+
+def get_stored_column_names(path):
+    """
+    Returns the names of the columns of stored columnar measurements
+    """
+    storage_format = get_columnar_format(path)
+
+    #If NumPy, check which column files exist
+    if storage_format == "numpy":
+        return [name for name in [epoch_column_name, *time_column_names, *zone_column_names]
+                if exists(join(path, f"{name}.npy"))]
+    #Else, read the schema
+    else:
+        pyarrow = import_pyarrow_io(storage_format)
+        if storage_format == ".parquet":
+            return pyarrow.parquet.read_schema(path).names
+        else:
+            return pyarrow.ipc.open_file(pyarrow.memory_map(path)).schema.names
+
+
+def load_columnar_measurements(path, zones=None, start=None, end=None):
+    """
+    Loads measurements saved with "save_measurements", and returns them as a tuple of two numpy arrays "(tvec, data)"
+    in the same format as "load_measurements".
+
+    "zones" is a list of zone indexes (0 to 3) to load, in the order they should appear in "data".
+    Defaults to all zones. Other zone columns are never read.
+
+    "start" and "end" restrict loading to measurements in the time range [start, end),
+    given as seconds since epoch (see "lib/epochs.py"). "None" leaves the range unbounded on that side.
+    Parquet row groups outside the range are skipped, and NumPy and Arrow columns are sliced with binary search.
+
+    Raises a "ValueError" if filtering by time range and the measurements have no dates (e.g. "hour of the day").
+    """
+    zones = list(range(zone_data_length)) if zones is None else list(zones)
+    names = time_column_names + [zone_column_names[z] for z in zones]
+
+    #Measurements without dates cannot be filtered by time
+    if (start is not None or end is not None) and epoch_column_name not in get_stored_column_names(path):
+        raise ValueError("Measurements without dates cannot be filtered by time")
+
+
+    columns = load_stored_columns(path, names, start, end)
+
+    #Gather time and zone columns into arrays
+    rows = len(columns[time_column_names[0]])
+    tvec = np.column_stack([columns[name] for name in time_column_names]).reshape(rows, time_data_length)
+    data = np.column_stack([columns[zone_column_names[z]] for z in zones]).reshape(rows, len(zones))
+
+    return (tvec, data)
@@ -1,9 +1,13 @@
 from lib.utilities import eprint
 from lib.data_fill_processors import *
+from lib.cache import load_cached_measurements, store_cached_measurements
+from lib.epochs import times_to_epochs
+from lib.instrument import stage
 
 import numpy as np
-import pandas as pd
-from os.path import exists, isfile
+from concurrent.futures import ProcessPoolExecutor
+from glob import glob
+from os.path import exists, isfile, getsize
 
 
 
@@ -14,6 +18,19 @@ def file_exists(file_path):
     return exists(file_path) and isfile(file_path)
 
 
+def expand_paths(paths):
+    """
+    Expands a glob pattern or a list of paths and glob patterns into a sorted list of file paths.
+    Paths that do not lead to files are ignored.
+    """
+    #Allow a single path or pattern
+    if isinstance(paths, str):
+        paths = [paths]
+
+    #Expand each pattern, and remove duplicates and non-files
+    return sorted({ path for pattern in paths for path in glob(pattern) if file_exists(path) })
+
+
 
 #Map "fmode" to its associated replacement generator
 fmodes = {
@@ -22,6 +39,106 @@ fmodes = {
     "drop": drop_replacement
 }
 
+def import_pandas():
+    """
+    Imports and returns the "pandas" module.
+    NOTE: Imported on first load instead of at startup, as importing pandas is slow.
+    """
+    import pandas
+    return pandas
+
+
+
+#Options of "pandas.read_csv" for the fixed measurement schema of the typed parser.
+#NOTE: All columns are parsed as floats without checking for missing values, which skips type inference.
+# Time columns are integers, so they are represented exactly and converted back afterwards.
+typed_csv_options = { "header": None, "dtype": np.float64, "na_filter": False }
+
+
+def split_typed_rows(rows):
+    """
+    Splits an (N, 10) float array of parsed rows into a tuple of (N, 6) integer times and (N, 4) float zones.
+    Typed counterpart of "get_times" and "get_zones".
+    """
+    #NOTE: A wrong number of columns would otherwise silently misplace times and zones
+    if rows.shape[1] != time_data_length + zone_data_length:
+        raise ValueError(f"Expected {time_data_length + zone_data_length} columns, found {rows.shape[1]}")
+
+    return (rows[:, :time_data_length].astype(np.int64),
+            np.ascontiguousarray(rows[:, time_data_length:]))
+
+
+def parse_measurements(filename):
+    """
+    Parses a headerless comma seperated file with the fixed schema of six integer time columns
+    followed by four float zone columns, and returns a tuple of (N, 6) integer times and (N, 4) float zones.
+    Column types are never inferred, and no data frame is kept around.
+
+    The pandas C parser parses all columns as floats with "typed_csv_options" into one array,
+    which is split with "split_typed_rows".
+    A wrong number of columns raises a "ValueError", and an empty file results in empty measurements.
+
+    NOTE: Parsing takes about as long as parsing with inferred types, as the C parser dominates either way.
+    """
+    columns = time_data_length + zone_data_length
+
+    #If empty, there is nothing to parse
+    if getsize(filename) == 0:
+        return split_typed_rows(np.empty((0, columns)))
+
+    pandas = import_pandas()
+    try:
+        rows = pandas.read_csv(filename, **typed_csv_options).to_numpy()
+    except pandas.errors.EmptyDataError:
+        rows = np.empty((0, columns))
+
+    return split_typed_rows(rows)
+
+
+
+#Default number of rows per chunk when streaming measurements
+stream_chunk_size = 100_000
+#Default maximum number of corrupted rows held back while waiting for a valid row to backward fill from
+stream_max_lookahead = 100_000
+
+
+#Types of times and zones in compact storage.
+#NOTE: Meter readings have about one decimal of precision, which float32 holds for readings up to about 10^5,
+# and every time unit fits into int16.
+compact_time_dtype = np.int16
+compact_zone_dtype = np.float32
+
+
+def compact_measurements(tvec, data):
+    """
+    Converts measurements to the compact storage types "compact_time_dtype" and "compact_zone_dtype",
+    which take a third of the memory of int64 times and float64 zones.
+    """
+    return (tvec.astype(compact_time_dtype), data.astype(compact_zone_dtype))
+
+
+#Map "fmode" to its associated bulk normalizer
+fmode_normalizers = {
+    "forward fill": forwfill_normalize,
+    "backward fill": backfill_normalize,
+    "drop": drop_normalize
+}
+
+
+def warn_fmode_fallback(fmode):
+    """
+    Prints a warning that the requested "fmode" could not be used, and that corrupted rows are dropped instead.
+    """
+    #If fmode is unknown, warn it is invalid
+    if fmode not in fmodes:
+        eprint(f"Invalid fill mode: {fmode}" +
+               "Falling back to dropping corrupted rows")
+    #Else, the first or last row is corrupted
+    else:
+        eprint(f"Could not {fmode} corrupted rows as " +
+               f"{'first' if fmode == 'forward fill' else 'last'} row is corrupted. " +
+               "Falling back to dropping corrupted rows")
+
 
 def enforce_fmode(fmode, raw_zones):
     """
@@ -32,16 +149,9 @@ def enforce_fmode(fmode, raw_zones):
     #If "fmode" is "backward fill", check if last row is corrupted
     fmode_backfill_impossible = fmode == "backward fill" and is_corrupted(raw_zones[-1])
 
-    #If requested mode is impossible, print warning and default to "fmode = drop"
-    if fmode_forwfill_impossible or fmode_backfill_impossible:
-        eprint(f"Could not {fmode} corrupted rows as " +
-               f"{'first' if fmode_forwfill_impossible else 'last'} row is corrupted. " +
-               "Falling back to dropping corrupted rows")
-        return "drop"
-    #Else if fmode is unknown, print warning and default to "fmode = drop"
-    elif fmode not in fmodes:
-        eprint(f"Invalid fill mode: {fmode}" +
-               "Falling back to dropping corrupted rows")
+    #If requested mode is impossible or unknown, print warning and default to "fmode = drop"
+    if fmode_forwfill_impossible or fmode_backfill_impossible or fmode not in fmodes:
+        warn_fmode_fallback(fmode)
         return "drop"
     #Else, allow requested "fmode"
     #WARN: Assuming there are only three "fmode = { "forward fill", "backward fill", "drop" }".
@@ -49,48 +159,20 @@ def enforce_fmode(fmode, raw_zones):
         return fmode
 
 
-def load_measurements(filename, fmode):
+def normalize_measurements_rowwise(raw_times, raw_zones, fmode):
     """
-    Loads data from a comma seperated file and returns a tuple of two numpy arrays of dimension (N, 6) and (N, 4) respectively: 
-        ([[year, month, day, hour, minute, second], 
-          ...], 
-         [[zone1, zone2, zone3, zone4],
-          ...])
-    
-    "fmode" can be one of:
-        "forward fill": Individual corrupted zone measurements are replaced with latest valid individual measurement.
-            First row must be a valid measurement, else "fmode" defaults to "drop.
-        "backward fill": Individual corrupted zone measurements are replaced with next valid individual measurement.
-            Last row must be a valid measurement, else "fmode" defaults to "drop.
-        "drop": Individual corrupted zone measurements will cause the whole measurement row to be deleted.
-    
-    
-    REMARK: Does not check for existence of file. Check before calling this function.
-    REMARK: Specification does not say file structure can be corrupted. It is assumed file has correct structure.
-    """
-    
-    #Read data from file
-    pd_rows = pd.read_csv(filename, header = None)
-    
-    #If there are no rows, return empty measurements
-    if len(pd_rows) == 0:
-        return (np.empty((0, time_data_length)),
-                np.empty((0, zone_data_length)))
-
+    Normalizes measurements one row at a time according to "fmode",
+    and returns a tuple of the normalized times and zones.
 
+    Reference implementation for "normalize_measurements".
 
-    #Split data into times and zones
-    (raw_times, raw_zones) = (get_times(pd_rows), 
-                              get_zones(pd_rows))
-
+    REMARK: Assumes "fmode" has already been enforced with "enforce_fmode".
+    """
     #Get all zones without corrupted data
     valid_zones = get_valid_zones(raw_zones)
 
-    #Select valid fmode based on zone data
-    selected_fmode = enforce_fmode(fmode, raw_zones)
-
     #Create zone replacement generator for zones with invalid data
-    replacement_gen = fmodes[selected_fmode](valid_zones)
+    replacement_gen = fmodes[fmode](valid_zones)
     replacement = iter(replacement_gen)
 
 
@@ -116,9 +198,338 @@ def load_measurements(filename, fmode):
             data.append(d)
 
 
+    #Return normalized measurements as numpy arrays
+    return (np.array(tvec), np.array(data))
+
+
+def normalize_measurements(raw_times, raw_zones, fmode, fill_per_zone=False):
+    """
+    Normalizes all measurements at once according to "fmode",
+    and returns a tuple of the normalized times and zones.
+
+    Produces the same result as "normalize_measurements_rowwise",
+    but finds and handles corrupted zone measurements with whole-array operations.
+    If "fill_per_zone" is true, each corrupted zone measurement is instead filled
+    from the nearest valid measurement of the same zone.
+
+    REMARK: Assumes "fmode" has already been enforced with "enforce_fmode".
+    """
+    return fmode_normalizers[fmode](raw_times, raw_zones, fill_per_zone)
+
+
+def load_measurements(filename, fmode, vectorized=True, fill_per_zone=False, use_cache=True, typed_parser=True,
+                      compact=False):
+    """
+    Loads data from a comma seperated file and returns a tuple of two numpy arrays of dimension (N, 6) and (N, 4) respectively: 
+        ([[year, month, day, hour, minute, second], 
+          ...], 
+         [[zone1, zone2, zone3, zone4],
+          ...])
+    
+    "fmode" can be one of:
+        "forward fill": Individual corrupted zone measurements are replaced with latest valid individual measurement.
+            First row must be a valid measurement, else "fmode" defaults to "drop.
+        "backward fill": Individual corrupted zone measurements are replaced with next valid individual measurement.
+            Last row must be a valid measurement, else "fmode" defaults to "drop.
+        "drop": Individual corrupted zone measurements will cause the whole measurement row to be deleted.
+    
+    If "vectorized" is false, the measurements are normalized one row at a time.
+    This is slower, but useful for checking the results of the vectorized normalization.
+    
+    If "fill_per_zone" is true, fill modes replace each corrupted zone measurement with the
+    latest or next valid measurement of the same zone, instead of from the latest or next fully valid row.
+    Not supported by the row by row normalization, so a "ValueError" is raised if not "vectorized".
+    
+    If "use_cache" is true, normalized measurements are cached in a binary format next to the file.
+    Later loads of the unchanged file with the same options memory-map the cache instead of parsing the file.
+    The cache is bypassed when not "vectorized".
+    
+    If "typed_parser" is true, the file is parsed with the fixed schema of "parse_measurements".
+    Else, it is parsed into a data frame with inferred column types first.
+    
+    If "compact" is true, measurements are returned with the compact types of "compact_measurements".
+    
+    
+    REMARK: Does not check for existence of file. Check before calling this function.
+    REMARK: Specification does not say file structure can be corrupted. It is assumed file has correct structure.
+    REMARK: Measurements returned from the cache are read-only.
+    """
+    
+    #Row by row normalization only fills from fully valid rows
+    if fill_per_zone and not vectorized:
+        raise ValueError("Filling per zone is not supported by the row by row normalization")
+
+    #Options that change the normalized measurements
+    cache_options = (fmode, fill_per_zone, "compact") if compact else (fmode, fill_per_zone)
+    use_cache = use_cache and vectorized
+
+    #If cached, skip parsing entirely
+    if use_cache:
+        with stage("data.cache_load") as record:
+            cached = load_cached_measurements(filename, cache_options)
+            record["rows"] = None if cached is None else len(cached[0])
+
+        #If cached, warn again if the requested fmode was not used for the cached measurements
+        if cached is not None:
+            (tvec, data, cached_fmode) = cached
+            if cached_fmode.item() != fmode:
+                warn_fmode_fallback(fmode)
+
+            return (tvec, data)
+
+
+    #Read data from file and split it into times and zones
+    with stage("data.parse") as record:
+        #If typed, parse straight into arrays
+        if typed_parser:
+            (raw_times, raw_zones) = parse_measurements(filename)
+        #Else, parse into a data frame first
+        else:
+            pd_rows = import_pandas().read_csv(filename, header = None)
+            (raw_times, raw_zones) = (get_times(pd_rows), 
+                                      get_zones(pd_rows))
+
+            #Release the parsed rows as the arrays hold all needed data
+            del pd_rows
+
+        record["rows"] = len(raw_times)
+    
+    #If there are no rows, return empty measurements
+    if len(raw_times) == 0:
+        return (np.empty((0, time_data_length), dtype=compact_time_dtype if compact else np.float64),
+                np.empty((0, zone_data_length), dtype=compact_zone_dtype if compact else np.float64))
+
+
+    #Select valid fmode based on zone data
+    selected_fmode = enforce_fmode(fmode, raw_zones)
+
     #NOTE: Reassigning, because specification specifies this
-    (tvec, data) = (np.array(tvec), np.array(data))
+    with stage("data.normalize", len(raw_zones)):
+        #If vectorized, normalize all rows at once
+        if vectorized:
+            (tvec, data) = normalize_measurements(raw_times, raw_zones, selected_fmode, fill_per_zone)
+        #Else, normalize row by row
+        else:
+            (tvec, data) = normalize_measurements_rowwise(raw_times, raw_zones, selected_fmode)
+
+    #If compact, convert to compact types after normalizing at full precision
+    if compact:
+        (tvec, data) = compact_measurements(tvec, data)
+
+    #Cache normalized measurements for later loads
+    if use_cache:
+        with stage("data.cache_store", len(tvec)):
+            store_cached_measurements(filename, cache_options, (tvec, data, np.array(selected_fmode)))
     
     #Return numpy arrays of times as integers and zones as floats
     return (tvec, data)
 
+
+
+def stream_measurements(filename, fmode, chunk_size=stream_chunk_size, 
+                        max_lookahead=stream_max_lookahead, fill_per_zone=False, typed_parser=True):
+    """
+    Generator that loads data from a comma seperated file in chunks of "chunk_size" rows,
+    and yields normalized measurements as tuples of numpy arrays "(tvec, data)" like "load_measurements".
+    Only one chunk (and the backward fill look-ahead) is kept in memory at a time.
+    
+    "fmode" and "fill_per_zone" behave like in "load_measurements", except:
+        "forward fill": The latest valid measurement is carried over from the previous chunk.
+        "backward fill": Corrupted rows at the end of a chunk are held back until a valid row is read.
+            At most "max_lookahead" rows are held back, older rows beyond this are dropped.
+            If the last rows of the file are corrupted, only those rows are dropped.
+
+    Yielded blocks are never empty, but may be smaller or larger than "chunk_size".
+    If "typed_parser" is true, chunks are parsed with the fixed schema of "typed_csv_options".
+
+    REMARK: Does not check for existence of file. Check before calling this function.
+    """
+    #Rows held back from the previous chunk, and the valid row to forward fill from
+    (carry_times, carry_zones) = (None, None)
+    fill_zone = None
+    selected_fmode = None
+
+    #Read and normalize one chunk at a time
+    csv_options = typed_csv_options if typed_parser else { "header": None }
+    for pd_rows in import_pandas().read_csv(filename, chunksize = chunk_size, **csv_options):
+        if typed_parser:
+            (raw_times, raw_zones) = split_typed_rows(pd_rows.to_numpy())
+        else:
+            (raw_times, raw_zones) = (get_times(pd_rows), 
+                                      get_zones(pd_rows))
+        del pd_rows
+
+        #Select valid fmode based on the first chunk.
+        #NOTE: Whether the last row is corrupted is unknown until the end of the file,
+        # so "backward fill" is never changed here.
+        if selected_fmode is None:
+            selected_fmode = fmode if fmode == "backward fill" else enforce_fmode(fmode, raw_zones)
+
+
+        #If forward filling, prepend the latest valid measurement from the previous chunk
+        if selected_fmode == "forward fill":
+            prepended = fill_zone is not None
+            if prepended:
+                raw_times = np.concatenate((raw_times[:1], raw_times))
+                raw_zones = np.concatenate((fill_zone, raw_zones))
+
+            (tvec, data) = normalize_measurements(raw_times, raw_zones, selected_fmode, fill_per_zone)
+
+            #Remember the latest valid measurement for the next chunk.
+            #NOTE: The last filled row only consists of latest valid measurements when filling per zone.
+            if fill_per_zone:
+                fill_zone = data[-1:]
+            else:
+                fill_zone = raw_zones[forwfill_indexes(~get_corrupted_rows(raw_zones))[-1:]]
+
+            #Remove the prepended measurement
+            if prepended:
+                (tvec, data) = (tvec[1:], data[1:])
+
+        #Else if backward filling, hold back rows after the last valid row until a valid row is read
+        elif selected_fmode == "backward fill":
+            if carry_times is not None:
+                raw_times = np.concatenate((carry_times, raw_times))
+                raw_zones = np.concatenate((carry_zones, raw_zones))
+
+            #Split after the last valid row
+            valid_indexes = np.flatnonzero(~get_corrupted_rows(raw_zones))
+            split = valid_indexes[-1] + 1 if len(valid_indexes) > 0 else 0
+
+            (carry_times, carry_zones) = (raw_times[split:], raw_zones[split:])
+            (tvec, data) = normalize_measurements(raw_times[:split], raw_zones[:split], 
+                                                  selected_fmode, fill_per_zone)
+
+            #If too many rows are held back, drop the oldest of them
+            overflow = len(carry_times) - max_lookahead
+            if overflow > 0:
+                eprint(f"Could not backward fill {overflow} corrupted rows " +
+                       f"as no valid row was found within {max_lookahead} rows. " +
+                       "Dropping these rows")
+                (carry_times, carry_zones) = (carry_times[overflow:], carry_zones[overflow:])
+
+        #Else, rows can be normalized independently of other chunks
+        else:
+            (tvec, data) = normalize_measurements(raw_times, raw_zones, selected_fmode, fill_per_zone)
+
+
+        #Yield normalized measurements if any
+        if len(tvec) > 0:
+            yield (tvec, data)
+
+
+    #If rows are still held back, the last rows of the file are corrupted
+    if carry_times is not None and len(carry_times) > 0:
+        eprint(f"Could not backward fill the last {len(carry_times)} rows as they are corrupted. " +
+               "Dropping these rows")
+
+
+
+def sort_by_epochs(epochs, *arrays):
+    """
+    Sorts measurements with times given as seconds since epoch by time,
+    and returns a tuple "(epochs, *arrays)" with the rows of each of "arrays" (e.g. zones) in the same order.
+    Any integer times ordered like time, such as time keys (see "lib/epochs.py"), can be used as "epochs".
+    Skips sorting if already sorted (usual for measurements).
+    """
+    if np.any(epochs[1:] < epochs[:-1]):
+        order = np.argsort(epochs, kind="stable")
+        return (epochs[order], *(array[order] for array in arrays))
+    else:
+        return (epochs, *arrays)
+
+
+def merge_measurements(epochs, zones, new_epochs, new_zones):
+    """
+    Merges new measurements into existing measurements, with times given as seconds since epoch.
+    Like in "sort_by_epochs", any integer times ordered like time can be used instead.
+    Existing measurements at the same times as any new measurement are replaced by the new measurements.
+    
+    Returns a tuple "(epochs, zones, removed_epochs, removed_zones)",
+    where the merged measurements are sorted by time,
+    and the removed measurements are the replaced existing measurements.
+    """
+    #Sort both existing and new measurements by time
+    (epochs, zones) = sort_by_epochs(epochs, zones)
+    (new_epochs, new_zones) = sort_by_epochs(new_epochs, new_zones)
+
+
+    #Find existing measurements overlapping with new measurements with binary search
+    overlapping = np.zeros(len(epochs), dtype=bool)
+    if len(new_epochs) > 0:
+        positions = np.minimum(np.searchsorted(new_epochs, epochs), len(new_epochs) - 1)
+        overlapping = new_epochs[positions] == epochs
+
+    (removed_epochs, removed_zones) = (epochs[overlapping], zones[overlapping])
+    (epochs, zones) = (epochs[~overlapping], zones[~overlapping])
+
+
+    #Insert new measurements at their sorted positions
+    insert_positions = np.searchsorted(epochs, new_epochs)
+    merged_epochs = np.insert(epochs, insert_positions, new_epochs)
+    merged_zones = np.insert(zones, insert_positions, new_zones, axis=0)
+
+    return (merged_epochs, merged_zones, removed_epochs, removed_zones)
+
+
+
+def load_many_measurements(paths, fmode, processes=None, fill_per_zone=False, use_cache=True, compact=False):
+    """
+    Loads data from multiple comma seperated files in parallel with a process pool,
+    and returns a tuple "(tvec, data, errors)".
+    "tvec" and "data" are the measurements of all files concatenated and sorted by time,
+    in the same format as "load_measurements".
+    "errors" is a list of tuples "(path, error)" for files that could not be loaded.
+    
+    "paths" is a glob pattern or a list of paths and glob patterns, see "expand_paths".
+    "processes" is the number of worker processes, and defaults to the number of CPU cores.
+    "fmode", "fill_per_zone", "use_cache" and "compact" are applied to each file individually, see "load_measurements".
+    """
+    paths = expand_paths(paths)
+    
+    #Prepare lists to store measurements and errors of each file in
+    tvecs = []
+    datas = []
+    errors = []
+
+    #Load each file in its own process
+    with ProcessPoolExecutor(max_workers=processes) as executor:
+        futures = [
+            (path, executor.submit(load_measurements, path, fmode, 
+                                   fill_per_zone=fill_per_zone, use_cache=use_cache, compact=compact))
+            for path in paths
+        ]
+
+        #Collect measurements in path order, and report errors per file
+        for path, future in futures:
+            try:
+                (tvec, data) = future.result()
+
+                #NOTE: Files are assumed to have the correct structure,
+                # but a wrong number of columns would break concatenation of all files.
+                if tvec.shape[1:] != (time_data_length,) or data.shape[1:] != (zone_data_length,):
+                    raise ValueError(f"Expected {time_data_length + zone_data_length} columns")
+            except Exception as e:
+                eprint(f"Could not load {path}: {e}")
+                errors.append((path, e))
+                continue
+
+            #Skip empty files as their arrays may not have the right types
+            if len(tvec) > 0:
+                tvecs.append(tvec)
+                datas.append(data)
+
+
+    #If no measurements, return empty measurements
+    if len(tvecs) == 0:
+        return (np.empty((0, time_data_length), dtype=compact_time_dtype if compact else np.int64),
+                np.empty((0, zone_data_length), dtype=compact_zone_dtype if compact else np.float64),
+                errors)
+
+    #Concatenate measurements of all files and sort by time
+    with stage("data.combine_files") as record:
+        (tvec, data) = (np.concatenate(tvecs), np.concatenate(datas))
+        order = np.argsort(times_to_epochs(tvec), kind="stable")
+        record["rows"] = len(tvec)
+
+    return (tvec[order], data[order], errors)
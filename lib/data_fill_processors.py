@@ -41,6 +41,20 @@ def is_corrupted(zone):
 
 
 
+def get_corrupted_mask(zones):
+    """
+    Get a boolean mask of corrupted zone measurements for a whole array of zones at once
+    """
+    return zones == -1
+
+def get_corrupted_rows(zones):
+    """
+    Get a boolean mask of rows (measurements) with any corrupted zone measurement
+    """
+    return get_corrupted_mask(zones).any(axis=1)
+
+
+
 def get_valid_zones(zones):
     """
     Generator that yields all zones without any corrupted measurements.
@@ -130,3 +144,109 @@ def drop_replacement(valid_zones):
     while True:
         yield None
 
+
+
+
+def forwfill_indexes(valid):
+    """
+    Computes the index of the most recent valid element for every element along the first axis.
+    "valid" is a boolean mask of shape (N,) for whole rows, or (N, zones) for individual zones.
+
+    REMARK: Assumes the first element is valid, else index 0 is used until the first valid element.
+    """
+    #Give valid elements their own index and invalid elements index 0,
+    # a running maximum then gives the index of the most recent valid element
+    indexes = np.arange(len(valid)).reshape(-1, *([1] * (valid.ndim - 1)))
+    valid_indexes = np.where(valid, indexes, 0)
+
+    return np.maximum.accumulate(valid_indexes, axis=0)
+
+
+def backfill_indexes(valid):
+    """
+    Computes the index of the next valid element for every element along the first axis.
+    "valid" is a boolean mask of shape (N,) for whole rows, or (N, zones) for individual zones.
+
+    REMARK: Assumes the last element is valid, else the last index is used after the last valid element.
+    """
+    #Give valid elements their own index and invalid elements the last index,
+    # a reversed running minimum then gives the index of the next valid element
+    indexes = np.arange(len(valid)).reshape(-1, *([1] * (valid.ndim - 1)))
+    valid_indexes = np.where(valid, indexes, len(valid) - 1)
+
+    return np.minimum.accumulate(valid_indexes[::-1], axis=0)[::-1]
+
+
+def fill_zones(zones, indexer, per_zone=False):
+    """
+    Replaces corrupted zone measurements with the valid measurements selected by "indexer".
+    "indexer" is one of "forwfill_indexes" or "backfill_indexes".
+
+    If "per_zone" is false, fills come from the nearest row without any corrupted zone measurement.
+    Else, each zone is filled from its own nearest valid measurement.
+    """
+    corrupted = get_corrupted_mask(zones)
+
+    #If filling per zone, find the source row for each zone individually
+    if per_zone:
+        source_indexes = indexer(~corrupted)
+        replacements = np.take_along_axis(zones, source_indexes, axis=0)
+    #Else, find the source row for whole rows
+    else:
+        source_indexes = indexer(~corrupted.any(axis=1))
+        replacements = zones[source_indexes]
+
+    #Only corrupted cells are replaced, valid cells are kept as they are
+    return np.where(corrupted, replacements, zones)
+
+
+def forwfill_zones(zones, per_zone=False):
+    """
+    Array-level forward fill that returns "zones" with corrupted zone measurements replaced
+    by the most recent valid measurements. See "fill_zones" for "per_zone".
+
+    REMARK: Assumes first row is not corrupted.
+    """
+    return fill_zones(zones, forwfill_indexes, per_zone)
+
+
+def backfill_zones(zones, per_zone=False):
+    """
+    Array-level backward fill that returns "zones" with corrupted zone measurements replaced
+    by the next valid measurements. See "fill_zones" for "per_zone".
+
+    REMARK: Assumes last row is not corrupted.
+    """
+    return fill_zones(zones, backfill_indexes, per_zone)
+
+
+def drop_normalize(times, zones, per_zone=False):
+    """
+    Bulk normalizer that deletes every row with any corrupted zone measurement.
+    Whole-array equivalent of "drop_replacement" and "normalize_row".
+    "per_zone" is accepted for a uniform normalizer signature, but has no effect.
+    """
+    #Keep only rows without corruption
+    keep = ~get_corrupted_rows(zones)
+
+    return (times[keep], zones[keep])
+
+
+def forwfill_normalize(times, zones, per_zone=False):
+    """
+    Bulk normalizer that replaces corrupted zone measurements with the most recent valid measurements.
+    Whole-array equivalent of "forwfill_replacement" and "normalize_row".
+
+    REMARK: Assumes first row is not corrupted.
+    """
+    return (times, forwfill_zones(zones, per_zone))
+
+
+def backfill_normalize(times, zones, per_zone=False):
+    """
+    Bulk normalizer that replaces corrupted zone measurements with the next valid measurements.
+    Whole-array equivalent of "backfill_replacement" and "normalize_row".
+
+    REMARK: Assumes last row is not corrupted.
+    """
+    return (times, backfill_zones(zones, per_zone))
@@ -0,0 +1,160 @@
+from lib.data_fill_processors import time_data_length
+
+import numpy as np
+
+
+"""
+Compact time representation.
+
+Times are passed around the public functions as (N, 6) integer arrays of
+[year, month, day, hour, minute, second].
+Internally, a time can instead be stored as one integer of seconds since 1970-01-01T00:00:00 (epoch),
+which is a sixth of the memory and allows sorting, grouping and searching on a single key.
+
+REMARK: Invalid dates (e.g. "2006-09-31") roll over into the next month when converted to epochs.
+
+Times can also be stored as time keys, which count seconds since 1970-01-01T00:00:00 as if every month had 31 days.
+Time keys sort like times and group by period with integer division like epochs,
+but keep every date as given (e.g. "2006-09-31" stays in September), so they are used for aggregation and raw data.
+Time keys do not measure elapsed time across month ends, so durations are measured with epochs.
+"""
+
+
+#Seconds per time unit
+seconds_per_minute = 60
+seconds_per_hour = 60 * seconds_per_minute
+seconds_per_day = 24 * seconds_per_hour
+
+#Seconds per month and year of time keys
+time_key_seconds_per_month = 31 * seconds_per_day
+time_key_seconds_per_year = 12 * time_key_seconds_per_month
+
+#Type of time keys in compact storage, covering 1970 to 2102.
+#NOTE: Unsigned, so widen to int64 before subtracting time keys.
+compact_time_key_dtype = np.uint32
+
+
+
+def has_dates(tvec):
+    """
+    Returns whether times have dates and can therefore be converted to seconds since epoch.
+    Times of "hour of the day" aggregations have no dates.
+    """
+    return len(tvec) == 0 or bool(np.all(tvec[:, 1] >= 1))
+
+
+def times_to_epochs(times):
+    """
+    Converts an (N, 6) array of times to an (N,) int64 array of seconds since epoch.
+    """
+    times = np.asarray(times, dtype=np.int64)
+
+    #Count months since epoch, and convert to days since epoch via numpy calendar arithmetic
+    months = (times[:, 0] - 1970) * 12 + (times[:, 1] - 1)
+    days = months.astype("datetime64[M]").astype("datetime64[D]").astype(np.int64) + (times[:, 2] - 1)
+
+    #Add time of day
+    return (days * seconds_per_day +
+            times[:, 3] * seconds_per_hour +
+            times[:, 4] * seconds_per_minute +
+            times[:, 5])
+
+
+def times_to_time_keys(times):
+    """
+    Converts an (N, 6) array of times to an (N,) int64 array of time keys.
+    Dates are not checked against the calendar, so invalid dates (e.g. "2006-09-31") keep their own key.
+
+    REMARK: Assumes times have dates with days from 1 to 31, so not aggregated by "hour of the day".
+    """
+    times = np.asarray(times, dtype=np.int64)
+
+    return ((times[:, 0] - 1970) * time_key_seconds_per_year +
+            (times[:, 1] - 1) * time_key_seconds_per_month +
+            (times[:, 2] - 1) * seconds_per_day +
+            times[:, 3] * seconds_per_hour +
+            times[:, 4] * seconds_per_minute +
+            times[:, 5])
+
+
+def time_keys_to_times(time_keys, dtype=np.int64):
+    """
+    Converts an (N,) array of time keys to an (N, 6) array of times.
+    Inverse operation of "times_to_time_keys".
+    """
+    time_keys = np.asarray(time_keys, dtype=np.int64)
+    times = np.empty((len(time_keys), time_data_length), dtype=dtype)
+
+    #Split off each time unit in turn
+    (years, year_seconds) = np.divmod(time_keys, time_key_seconds_per_year)
+    (months, month_seconds) = np.divmod(year_seconds, time_key_seconds_per_month)
+    (days, day_seconds) = np.divmod(month_seconds, seconds_per_day)
+
+    (times[:, 0], times[:, 1], times[:, 2]) = (years + 1970, months + 1, days + 1)
+    (times[:, 3], hour_seconds) = np.divmod(day_seconds, seconds_per_hour)
+    (times[:, 4], times[:, 5]) = np.divmod(hour_seconds, seconds_per_minute)
+
+    return times
+
+
+def epochs_to_time_keys(epochs):
+    """
+    Converts an array of seconds since epoch to time keys, e.g. to find a time range within time keys
+    """
+    return times_to_time_keys(epochs_to_times(epochs))
+
+
+def time_keys_to_epochs(time_keys):
+    """
+    Converts an array of time keys to seconds since epoch, e.g. to measure durations.
+    Invalid dates roll over like in "times_to_epochs".
+    """
+    return times_to_epochs(time_keys_to_times(time_keys))
+
+
+def compact_time_keys(time_keys):
+    """
+    Converts an array of time keys to "compact_time_key_dtype".
+    Raises a "ValueError" if any time is outside of the range of the compact type.
+    """
+    time_keys = np.asarray(time_keys)
+    limits = np.iinfo(compact_time_key_dtype)
+
+    if len(time_keys) > 0 and (time_keys.min() < limits.min or time_keys.max() > limits.max):
+        raise ValueError("Times must be between 1970 and 2102 to be stored compactly")
+
+    return time_keys.astype(compact_time_key_dtype)
+
+
+def epochs_to_datetimes(epochs):
+    """
+    Converts an array of seconds since epoch to a "numpy.datetime64" array.
+    """
+    return np.asarray(epochs, dtype=np.int64).astype("datetime64[s]")
+
+
+def epochs_to_times(epochs, dtype=np.int64):
+    """
+    Converts an (N,) array of seconds since epoch to an (N, 6) array of times.
+    Inverse operation of "times_to_epochs" for valid dates.
+    """
+    epochs = np.asarray(epochs, dtype=np.int64)
+
+    #Split into days since epoch and seconds into the day
+    (days, day_seconds) = np.divmod(epochs, seconds_per_day)
+
+    #Use numpy calendar arithmetic to find year, month and day of month
+    dates = days.astype("datetime64[D]")
+    months = dates.astype("datetime64[M]")
+    years = months.astype("datetime64[Y]")
+
+    #Store each time unit in its own column
+    times = np.empty((len(epochs), time_data_length), dtype=dtype)
+    times[:, 0] = years.astype(np.int64) + 1970
+    times[:, 1] = (months - years).astype(np.int64) + 1
+    times[:, 2] = (dates - months).astype(np.int64) + 1
+    (times[:, 3], hour_seconds) = np.divmod(day_seconds, seconds_per_hour)
+    (times[:, 4], times[:, 5]) = np.divmod(hour_seconds, seconds_per_minute)
+
+    return times
+
@@ -0,0 +1,72 @@
+from lib.aggregate import aggregate_measurements, period_to_status
+from lib.plot import save_plot, import_pyplot
+from lib.utilities import eprint
+
+from concurrent.futures import ProcessPoolExecutor
+from os import makedirs
+from os.path import join
+
+
+#File formats plots can be exported to
+export_formats = ["png", "svg", "pdf"]
+
+#Default measurement unit label of exported plots
+default_measurement_unit_status = "Usage in watt-hour"
+
+
+
+def use_headless_backend():
+    """
+    Switch plotting to a non-interactive backend, so plots can be rendered without a display.
+    Used as initializer of export worker processes.
+    """
+    import_pyplot().switch_backend("Agg")
+
+
+def plot_file_name(name, period, combined):
+    """
+    Returns the file name (without extension) of an exported plot
+    """
+    return f"{name}-{period.replace(' ', '_')}-{'combined' if combined else 'zones'}"
+
+
+def export_plots(tvec, data, periods, directory, formats=["png"], name="usage",
+                 measurement_unit_status=default_measurement_unit_status, processes=None):
+    """
+    Aggregates measurements for each period in "periods",
+    and saves zone and combined plots of each aggregation to "directory" in each of the file "formats".
+    Figures are rendered in parallel with a process pool using a non-interactive backend,
+    so no display is needed.
+
+    "processes" is the number of worker processes, and defaults to the number of CPU cores.
+    Returns a list of the paths of the saved files.
+    Figures that fail to render are reported and skipped.
+    """
+    makedirs(directory, exist_ok=True)
+
+    #Prepare list to store saved file paths in
+    saved_paths = []
+
+    with ProcessPoolExecutor(max_workers=processes, initializer=use_headless_backend) as executor:
+        #Aggregate each period here, so workers only receive aggregated data
+        futures = []
+        for period in periods:
+            (times, zones) = aggregate_measurements(tvec, data, period)
+            labels = [period_to_status[period], measurement_unit_status]
+
+            #Render the zone plots and the combined plot of the period in separate workers
+            for combined in [False, True]:
+                base_path = join(directory, plot_file_name(name, period, combined))
+                paths = [f"{base_path}.{file_format}" for file_format in formats]
+                futures.append((paths, executor.submit(save_plot, times, zones, combined, labels, paths)))
+
+        #Wait for each figure to be saved and report failures
+        for paths, future in futures:
+            try:
+                future.result()
+                saved_paths.extend(paths)
+            except Exception as e:
+                eprint(f"Could not export {', '.join(paths)}: {e}")
+
+
+    return saved_paths
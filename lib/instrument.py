@@ -0,0 +1,199 @@
+from lib.utilities import eprint
+
+import json
+from contextlib import contextmanager
+from threading import Lock, current_thread, local
+from time import perf_counter, time
+from tracemalloc import is_tracing, start as start_tracing, stop as stop_tracing, get_traced_memory, reset_peak
+
+
+"""
+Opt-in instrumentation of pipeline stages.
+
+Stages (e.g. parsing, normalizing, grouping, sorting, plotting) are wrapped in "stage".
+When instrumentation is enabled with "enable_instrumentation", each stage records its
+wall time, number of rows and peak memory allocated, and each record is appended as a line of JSON
+to the trace file. When disabled, stages only cost a function call.
+
+Stage names are prefixed by their module, e.g. "data.parse" or "aggregate.group".
+"""
+
+
+#Number of most recent stage records kept in memory for "get_instrumentation_status"
+recent_stage_count = 8
+
+
+#Current instrumentation settings, "None" when disabled
+instrumentation = None
+
+#Stack of stages currently running in each thread, so nested stages can report to their parent
+stage_stacks = local()
+
+
+
+def enable_instrumentation(trace_path=None, trace_memory=True):
+    """
+    Enables recording of stages.
+    If "trace_path" is given, each stage record is appended to it as a line of JSON.
+    If "trace_memory" is true, peak memory allocated by each stage is measured with "tracemalloc",
+    which slows down allocations.
+    """
+    global instrumentation
+
+    #Start tracing memory unless already traced
+    started_tracing = trace_memory and not is_tracing()
+    if started_tracing:
+        start_tracing()
+
+    instrumentation = {
+        "trace_path": trace_path,
+        "trace_memory": trace_memory,
+        "started_tracing": started_tracing,
+        "recent": [],
+        "lock": Lock(),
+    }
+
+
+def disable_instrumentation():
+    """
+    Disables recording of stages, and stops tracing memory if started by "enable_instrumentation".
+    """
+    global instrumentation
+
+    if instrumentation is not None and instrumentation["started_tracing"]:
+        stop_tracing()
+
+    instrumentation = None
+
+
+def is_instrumented():
+    """
+    Returns whether stages are currently recorded
+    """
+    return instrumentation is not None
+
+
+
+def record_stage(record):
+    """
+    Stores a finished stage record and appends it to the trace file if any.
+    Trace write failures are reported, but never interrupt the pipeline.
+    """
+    settings = instrumentation
+    if settings is None:
+        return
+
+    with settings["lock"]:
+        settings["recent"] = (settings["recent"] + [record])[-recent_stage_count:]
+
+        if settings["trace_path"] is not None:
+            try:
+                with open(settings["trace_path"], "a") as file:
+                    file.write(json.dumps(record) + "\n")
+            except OSError as e:
+                eprint(f"Could not write trace to {settings['trace_path']}: {e}")
+
+
+@contextmanager
+def stage(name, rows=None):
+    """
+    Context manager recording the stage "name" when instrumentation is enabled.
+    Yields a dictionary record, whose "rows" can be set inside the stage when not known beforehand.
+
+    Each record holds:
+        "stage": Name of the stage
+        "start": Start time in seconds since epoch
+        "seconds": Wall time of the stage
+        "rows": Number of rows processed, or None if not given
+        "peak_bytes": Peak memory allocated during the stage, or None if memory is not traced
+        "thread": Name of the thread running the stage
+
+    REMARK: Memory is traced for the whole process,
+    so stages running concurrently in other threads are included in the peak.
+    """
+    record = { "stage": name, "rows": rows }
+
+    #If disabled, only hand out the record
+    settings = instrumentation
+    if settings is None:
+        yield record
+        return
+
+
+    #Prepare to measure memory relative to the start of the stage
+    trace_memory = settings["trace_memory"] and is_tracing()
+    stack = stage_stacks.__dict__.setdefault("stack", [])
+    frame = { "peak": 0, "baseline": 0 }
+
+    if trace_memory:
+        (frame["baseline"], peak) = get_traced_memory()
+
+        #Keep the peak so far of the enclosing stage, as it is reset for this stage
+        if len(stack) > 0:
+            stack[-1]["peak"] = max(stack[-1]["peak"], peak)
+        reset_peak()
+
+    stack.append(frame)
+    (record["start"], start) = (time(), perf_counter())
+
+    try:
+        yield record
+    finally:
+        record["seconds"] = perf_counter() - start
+        stack.pop()
+
+        #Peak memory is the highest peak seen during the stage, including nested stages
+        record["peak_bytes"] = None
+        if trace_memory and is_tracing():
+            (_, peak) = get_traced_memory()
+            peak = max(frame["peak"], peak)
+            record["peak_bytes"] = peak - frame["baseline"]
+
+            #The enclosing stage saw the same peak
+            if len(stack) > 0:
+                stack[-1]["peak"] = max(stack[-1]["peak"], peak)
+
+        record["thread"] = current_thread().name
+        record_stage(record)
+
+
+
+def format_stage(record):
+    """
+    Formats a stage record as a short string, e.g. "data.parse 1.23 s (500000 rows, 96.0 MiB)"
+    """
+    seconds = record["seconds"]
+    duration = f"{seconds:.2f} s" if seconds >= 1 else f"{seconds * 1000:.0f} ms"
+
+    details = []
+    if record["rows"] is not None:
+        details.append(f"{record['rows']} rows")
+    if record["peak_bytes"] is not None:
+        details.append(f"{record['peak_bytes'] / 1024 ** 2:.1f} MiB")
+
+    return f"{record['stage']} {duration}" + (f" ({', '.join(details)})" if len(details) > 0 else "")
+
+
+def get_recent_stages():
+    """
+    Returns a list of the most recent stage records, oldest first.
+    Empty if instrumentation is disabled.
+    """
+    settings = instrumentation
+    if settings is None:
+        return []
+
+    with settings["lock"]:
+        return list(settings["recent"])
+
+
+def get_instrumentation_status():
+    """
+    Returns a short summary of the most recent stages for status lines,
+    or None if instrumentation is disabled or nothing has been recorded yet.
+    """
+    records = get_recent_stages()[-3:]
+    if len(records) == 0:
+        return None
+
+    return "Last stages: " + "; ".join(format_stage(record) for record in records)
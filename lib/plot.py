@@ -1,24 +1,48 @@
-from datetime import datetime
-import matplotlib.pyplot as plt
+from lib.epochs import times_to_epochs, epochs_to_datetimes
+from lib.instrument import stage
+
 import numpy as np
 
 
+def import_pyplot():
+    """
+    Imports and returns the "matplotlib.pyplot" module.
+    NOTE: Imported on first plot instead of at startup, as importing matplotlib is slow.
+    """
+    import matplotlib.pyplot
+    return matplotlib.pyplot
+
+
+
 #Define axis label style for subplots
 axis_label_style = { "fontsize": 12, "fontweight": "bold" }
 
 #Define size of plot GUI
 plot_size = (16, 7)
 
-#Define time formats
-hour_format = "{:02d}:{:02d}"
-date_format = "{:04d}-{:02d}-{:02d}T{:02d}:{:02d}:{:02d}"
+#Define maximum number of points drawn per line plot before decimating, at least 2.
+#Set to "None" to always draw every point.
+line_plot_max_points = 4000
+
+#Define separator of hour format
+hour_separator = ":"
+
+
+def format_hours(times):
+    """
+    Convert times to 24-hour strings ("HH:MM") with array operations.
+    """
+    #Zero pad hours and minutes to two digits and join them
+    (hours, minutes) = (np.char.zfill(times[:, c].astype(str), 2) for c in (3, 4))
+
+    return np.char.add(np.char.add(hours, hour_separator), minutes)
 
 
 def times_to_axis(times):
     """
     Convert times to a format usable as axis tick labels.
     If times are in hour format, converts to 24-hour strings.
-    Else converts to "datetime" objects.
+    Else converts to a "numpy.datetime64" array.
     
     Returns a tuple "(axis_times, hour_mode)".
     """
@@ -27,18 +51,43 @@ def times_to_axis(times):
     
     #If hour mode, convert to 24-hour strings
     if hour_mode:
-        axis_times = [hour_format.format(*time[3:5])
-                      for time in times]
-    #Else, convert times to "datetime" objects
+        axis_times = format_hours(times)
+    #Else, convert all times to "numpy.datetime64" at once via seconds since epoch
     else:
-        axis_times = [datetime.strptime(date_format.format(*time), 
-                                        "%Y-%m-%dT%H:%M:%S")
-                      for time in times]
+        axis_times = epochs_to_datetimes(times_to_epochs(times))
 
     #Return converted times and whether times are in hour mode
     return (axis_times, hour_mode)
 
 
+def decimate_indexes(y, max_points):
+    """
+    Select indexes of at most "max_points" points to draw of a series "y", while keeping its peaks visible.
+    The series is split into "max_points / 2" equally sized buckets,
+    and the minimum and maximum point of each bucket is kept in their original order.
+    Raises a "ValueError" if "max_points" is less than 2, as each bucket keeps two points.
+    """
+    if max_points < 2:
+        raise ValueError(f"Maximum number of points to draw must be at least 2, got {max_points}")
+
+    #If few enough points, keep all points
+    if len(y) <= max_points:
+        return np.arange(len(y))
+
+    #Split series into buckets of equal width, padding the last bucket with its last point
+    width = -(-len(y) // (max_points // 2))
+    buckets = -(-len(y) // width)
+    padded = np.pad(y, (0, buckets * width - len(y)), mode="edge").reshape(buckets, width)
+
+    #Find the minimum and maximum of each bucket
+    offsets = np.arange(buckets) * width
+    indexes = np.concatenate((offsets + padded.argmin(axis=1), 
+                              offsets + padded.argmax(axis=1)))
+
+    #Return unique indexes in order, moving padded indexes to the last point
+    return np.unique(np.minimum(indexes, len(y) - 1))
+
+
 def set_axis_labels(fig, x_label, y_label):
     """
     Set axis labels
@@ -56,9 +105,25 @@ def style_x_labels(fig):
 
 
 
-def draw_bar_plot(fig, x, y, labels):
+def draw_overlays(fig, x_times, overlays):
+    """
+    Draw overlay series "overlays" given as a list of tuples "(label, y)" as lines over a plot, and label them in a legend.
+    """
+    #If no overlays, there is nothing to draw
+    if len(overlays) == 0:
+        return
+
+    #Draw each overlay in front of the plot
+    for label, y in overlays:
+        fig.plot(x_times, y, "-", label=label, linewidth=2, zorder=3)
+
+    fig.legend(loc="upper right")
+
+
+def draw_bar_plot(fig, x, y, labels, overlays=[]):
     """
     Draw a bar plot based off of the given data.
+    "overlays" are drawn as lines over the bars, see "draw_overlays".
     """
 
     #Convert times to a displayable format
@@ -70,9 +135,10 @@ def draw_bar_plot(fig, x, y, labels):
 
     #Draw plot
     fig.bar(x_times, y, zorder=2)
+    draw_overlays(fig, x_times, overlays)
 
 
-    #If necessary, enable processing of "datetime" objects on the x-axis
+    #If necessary, enable processing of dates on the x-axis
     if not hour_mode:
         fig.xaxis_date()
 
@@ -82,11 +148,24 @@ def draw_bar_plot(fig, x, y, labels):
     style_x_labels(fig)
 
 
-def draw_line_plot(fig, x, y, labels):
+def draw_line_plot(fig, x, y, labels, max_points=None, overlays=[]):
     """
     Draw a line plot based off of the given data.
+    If there are more than "max_points" points, the line is decimated with "decimate_indexes" before drawing.
+    "max_points" defaults to "line_plot_max_points".
+    
+    "overlays" are series at the same times as "y" (e.g. rolling averages from "lib/rolling.py")
+    drawn over the line, see "draw_overlays". They are decimated at the same points as "y".
     """
 
+    #Decimate line if it has too many points to draw quickly
+    max_points = line_plot_max_points if max_points is None else max_points
+    if max_points is not None and len(y) > max_points:
+        indexes = decimate_indexes(y, max_points)
+        (x, y) = (x[indexes], y[indexes])
+        overlays = [(label, overlay[indexes]) for label, overlay in overlays]
+
+
     #Convert times to a displayable format
     (x_times, hour_mode) = times_to_axis(x)
 
@@ -96,9 +175,10 @@ def draw_line_plot(fig, x, y, labels):
 
     #Draw plot
     fig.plot(x_times, y, "-", label=None, zorder=2)
+    draw_overlays(fig, x_times, overlays)
     
     
-    #If necessary, enable processing of "datetime" objects on the x-axis
+    #If necessary, enable processing of dates on the x-axis
     if not hour_mode:
         fig.xaxis_date()
 
@@ -109,12 +189,14 @@ def draw_line_plot(fig, x, y, labels):
 
 
 
-def draw_zones(times, zones, plot_drawer, labels):
+def draw_zones(times, zones, plot_drawer, labels, overlays=[]):
     """
     Divide plot into four subplots and draw plots for usage in each zone.
+    Each zone of "overlays" is drawn over the plot of the zone, see "draw_plot".
+    Returns the figure.
     """
     #Divide into four subplots
-    fig, (fig_zones) = plt.subplots(2, 2)
+    fig, (fig_zones) = import_pyplot().subplots(2, 2)
     #Set size and spacing
     fig.subplots_adjust(bottom=0.18, hspace=1.1)
     fig.set_size_inches(*plot_size)
@@ -124,15 +206,19 @@ def draw_zones(times, zones, plot_drawer, labels):
         #Set title of plot for zone
         fig_zone.set_title(f"Zone {i+1} energy usage by time", **axis_label_style)
         #Draw plot for zone
-        plot_drawer(fig_zone, times, zones[:, i], labels)
+        plot_drawer(fig_zone, times, zones[:, i], labels, overlays=[(label, overlay[:, i]) for label, overlay in overlays])
+
+    return fig
 
 
-def draw_combined(times, zones, plot_drawer, labels):
+def draw_combined(times, zones, plot_drawer, labels, overlays=[]):
     """
-    Draw one big plot for the combined usage of the zones
+    Draw one big plot for the combined usage of the zones.
+    The total of "overlays" is drawn over the plot, see "draw_plot".
+    Returns the figure.
     """
     #Create one big plot area
-    fig, (fig_combined) = plt.subplots(1, 1)
+    fig, (fig_combined) = import_pyplot().subplots(1, 1)
     #Set size and spacing
     fig.subplots_adjust(bottom=0.24)
     fig.set_size_inches(*plot_size)
@@ -140,22 +226,23 @@ def draw_combined(times, zones, plot_drawer, labels):
     #Set title of plot
     fig_combined.set_title("Combined energy usage by time", **axis_label_style)
     #Draw plot of combined usage
-    plot_drawer(fig_combined, times, zones.sum(axis=1), labels)
+    plot_drawer(fig_combined, times, zones.sum(axis=1), labels, overlays=[(label, overlay[:, -1]) for label, overlay in overlays])
 
+    return fig
 
 
-def show_plot(times, zones, combined, labels):
+
+def draw_plot(times, zones, combined, labels, overlays=[]):
     """
-    Shows a GUI of the energy usage. 
-    If "combined" is "False" each zone will be shown in their own plots,
+    Draws a figure of the energy usage and returns it.
+    If "combined" is "False" each zone will be drawn in their own plots,
     else, the combined usage will be plotted.
     If there are less than 25 measurements, bar plots will be used instead of line plots.
-    NOTE: Blocks thread while the GUI is open.
+    
+    "overlays" is a list of tuples "(label, series)" drawn over the usage,
+    where each series has a column per zone followed by a column of the total at the same times as "zones"
+    (e.g. from "rolling_measurements" in "lib/rolling.py").
     """
-
-    #Inform user of current action
-    print("Loading plots...")
-
     #If less than 25 aggregated data points, draw bar plots
     if len(times) < 25:
         plot_drawer = draw_bar_plot
@@ -163,12 +250,26 @@ def show_plot(times, zones, combined, labels):
     else:
         plot_drawer = draw_line_plot
 
-    #If zone energy usage should be shown combined, draw combined plot
-    if combined:
-        draw_combined(times, zones, plot_drawer, labels)
-    #Else, draw plots for each zone
-    else:
-        draw_zones(times, zones, plot_drawer, labels)
+    with stage("plot.draw", len(times)):
+        #If zone energy usage should be shown combined, draw combined plot
+        if combined:
+            return draw_combined(times, zones, plot_drawer, labels, overlays)
+        #Else, draw plots for each zone
+        else:
+            return draw_zones(times, zones, plot_drawer, labels, overlays)
+
+
+def show_plot(times, zones, combined, labels, overlays=[]):
+    """
+    Shows a GUI of the energy usage. See "draw_plot".
+    NOTE: Blocks thread while the GUI is open.
+    """
+
+    #Inform user of current action
+    print("Loading plots...")
+
+    #Draw plot
+    draw_plot(times, zones, combined, labels, overlays)
 
 
     #Print instructions for how to continue
@@ -177,4 +278,20 @@ def show_plot(times, zones, combined, labels):
 
     #Show finished plot
     #NOTE: Blocks thread until GUI is closed
-    plt.show()
+    import_pyplot().show()
+
+
+def save_plot(times, zones, combined, labels, paths):
+    """
+    Saves a figure of the energy usage to each file path in "paths" without showing a GUI. See "draw_plot".
+    The file format is chosen by the file extension of each path (e.g. ".png", ".svg", or ".pdf").
+    """
+    #Draw plot
+    fig = draw_plot(times, zones, combined, labels)
+
+    #Save figure in each format and free its memory
+    with stage("plot.save", len(times)):
+        for path in paths:
+            fig.savefig(path)
+
+    import_pyplot().close(fig)
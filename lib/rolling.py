@@ -0,0 +1,87 @@
+from lib.epochs import times_to_epochs, seconds_per_hour, seconds_per_day
+from lib.time_index import build_prefix_sums
+
+import numpy as np
+
+
+"""
+Rolling-window sums and means of zone measurements.
+
+Each measurement gets the sum (or mean) of all measurements in the trailing window (t - window, t] ending at its time.
+Timestamps may be irregular (e.g. gaps from dropped measurements), as windows are defined by time, not by rows.
+
+Window sums are differences of prefix sums (see "build_prefix_sums"),
+and the start of every window is found with one binary search over all (sorted) window starts,
+so all zones and the total are computed with a few whole-array operations, without a loop over windows.
+
+Results have a column per zone followed by a column of the total of all zones,
+and can be drawn over the measurements with the "overlays" of "lib/plot.py".
+"""
+
+
+#Map from window name to window length in seconds
+rolling_windows = {
+    "1 hour": seconds_per_hour,
+    "24 hours": seconds_per_day,
+    "7 days": 7 * seconds_per_day,
+}
+
+#Rolling statistics
+rolling_statistics = ["sum", "mean"]
+
+
+
+def window_starts(epochs, window):
+    """
+    Returns the index of the first measurement of the trailing window (t - window, t] of each measurement,
+    for sorted seconds since epoch "epochs".
+    """
+    #NOTE: Widening first, as compact epochs are unsigned
+    epochs = np.asarray(epochs, dtype=np.int64)
+    return np.searchsorted(epochs, epochs - window, side="right")
+
+
+def window_sums(zones, starts):
+    """
+    Returns the sum of each zone and of all zones over the rows [starts[i], i] of each row "i" of "zones".
+    The result has shape (N, zones + 1), where the last column is the total of all zones.
+    """
+    #Sum each zone within each window as a difference of prefix sums
+    prefix_sums = build_prefix_sums(zones)
+    sums = prefix_sums[1:] - prefix_sums[starts]
+
+    return np.append(sums, sums.sum(axis=1, keepdims=True), axis=1)
+
+
+def rolling_sums(epochs, zones, window):
+    """
+    Returns the sum of each zone and of all zones over the trailing window of "window" seconds of each measurement.
+    "epochs" are the sorted seconds since epoch of "zones". See "window_sums" for the shape of the result.
+    """
+    return window_sums(zones, window_starts(epochs, window))
+
+
+def rolling_means(epochs, zones, window):
+    """
+    Returns the mean of each zone and of all zones over the trailing window of "window" seconds of each measurement.
+    Like "rolling_sums", but divided by the number of measurements in each window.
+    """
+    starts = window_starts(epochs, window)
+    counts = np.arange(1, len(zones) + 1) - starts
+
+    return window_sums(zones, starts) / counts[:, None]
+
+
+def rolling_measurements(tvec, data, window, statistic="mean"):
+    """
+    Returns the rolling "statistic" ("sum" or "mean") over "window" seconds of measurements "(tvec, data)"
+    sorted by time. See "rolling_sums" and "rolling_means".
+
+    REMARK: Assumes times have dates, so not aggregated by "hour of the day".
+    """
+    epochs = times_to_epochs(tvec)
+
+    if statistic == "sum":
+        return rolling_sums(epochs, data, window)
+    else:
+        return rolling_means(epochs, data, window)
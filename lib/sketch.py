@@ -0,0 +1,135 @@
+import numpy as np
+from math import ceil
+
+
+#Default approximate rank error of quantile sketches (fraction of the number of values)
+default_sketch_error = 0.01
+
+#Smallest allowed compactor size to keep sketches meaningful for large errors
+min_sketch_k = 8
+
+#Factor each lower compactor shrinks by relative to the compactor above it
+sketch_capacity_decay = 2 / 3
+
+
+
+class QuantileSketch:
+    """
+    A mergeable streaming quantile sketch (KLL) over a stream of values.
+
+    Values are added in chunks with "update", and memory stays bounded by the error regardless of the number of values.
+    Quantiles are approximate with a rank error of roughly "error" times the number of values,
+    while the minimum and maximum are exact.
+    Sketches fed with separate chunks, files or workers can be combined with "merge".
+
+    Values are stored in levels of compactors, where a value at level "h" represents 2^h values.
+    When a level grows past its capacity, it is sorted and every other value is promoted to the level above.
+    """
+
+    def __init__(self, error=default_sketch_error, seed=None):
+        #NOTE: Compactor size is chosen so the rank error is roughly "error"
+        self.k = max(min_sketch_k, ceil(2.7 / error))
+        self.levels = [np.empty(0)]
+
+        self.count = 0
+        self.minimum = np.inf
+        self.maximum = -np.inf
+
+        self.rng = np.random.default_rng(seed)
+
+
+    def capacity(self, height):
+        """
+        Method to get the capacity of the compactor at a level
+        """
+        depth = len(self.levels) - height - 1
+        return max(2, ceil(self.k * sketch_capacity_decay ** depth))
+
+    def compress(self):
+        """
+        Method to compact levels until every level is within its capacity
+        """
+        #Keep compacting as adding levels lowers the capacity of the levels below
+        while any(len(level) > self.capacity(h) for h, level in enumerate(self.levels)):
+            for h in range(len(self.levels)):
+                level = self.levels[h]
+                if len(level) <= self.capacity(h):
+                    continue
+
+                #If compacting the top level, add a level above it
+                if h + 1 == len(self.levels):
+                    self.levels.append(np.empty(0))
+
+                #Keep one value if odd, and promote every other value of the rest at a random offset
+                level = np.sort(level)
+                kept = level[:len(level) % 2]
+                promoted = level[len(kept) + self.rng.integers(2)::2]
+
+                self.levels[h] = kept
+                self.levels[h + 1] = np.concatenate((self.levels[h + 1], promoted))
+
+
+    def update(self, values):
+        """
+        Method to add a chunk of values to the sketch
+        """
+        values = np.asarray(values, dtype=np.float64).reshape(-1)
+
+        #If no values, there is nothing to add
+        if len(values) == 0:
+            return
+
+        #Track exact extremes and count
+        self.count += len(values)
+        self.minimum = min(self.minimum, values.min())
+        self.maximum = max(self.maximum, values.max())
+
+        #Add values to the lowest level and compact
+        self.levels[0] = np.concatenate((self.levels[0], values))
+        self.compress()
+
+    def merge(self, other):
+        """
+        Method to add all values of another sketch to this sketch.
+        The other sketch is not changed.
+        """
+        #Combine exact extremes and count
+        self.count += other.count
+        self.minimum = min(self.minimum, other.minimum)
+        self.maximum = max(self.maximum, other.maximum)
+
+        #Combine values level by level and compact
+        while len(self.levels) < len(other.levels):
+            self.levels.append(np.empty(0))
+
+        for h, level in enumerate(other.levels):
+            self.levels[h] = np.concatenate((self.levels[h], level))
+
+        self.compress()
+
+
+    def quantile(self, q):
+        """
+        Method to get approximate quantiles "q" (a number or an array of numbers in [0, 1]).
+        Interpolates linearly between values like "numpy.quantile".
+        Returns NaN if the sketch is empty.
+        """
+        q = np.asarray(q, dtype=np.float64)
+
+        #If no values, quantiles are undefined
+        if self.count == 0:
+            return np.full(q.shape, np.nan)
+
+        #Weigh each value by the number of values it represents and sort
+        values = np.concatenate(self.levels)
+        weights = np.concatenate([np.full(len(level), 2.0 ** h) for h, level in enumerate(self.levels)])
+        order = np.argsort(values, kind="stable")
+        (values, weights) = (values[order], weights[order])
+
+        #Find the center rank of each value and interpolate quantile ranks between them
+        center_ranks = np.cumsum(weights) - (weights + 1) / 2
+        quantiles = np.interp(q * (self.count - 1), center_ranks, values)
+
+        #Extremes are exact
+        return np.clip(np.where(q == 0, self.minimum, np.where(q == 1, self.maximum, quantiles)),
+                       self.minimum, self.maximum)
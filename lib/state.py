@@ -1,16 +1,56 @@
-from lib.aggregate import period_to_status
+from lib.aggregate import period_to_status, update_rollup, query_rollup
+from lib.data import merge_measurements, sort_by_epochs, compact_time_dtype, compact_zone_dtype
+from lib.epochs import (times_to_time_keys, time_keys_to_times, epochs_to_time_keys, compact_time_keys,
+                        seconds_per_day)
+from lib.instrument import get_instrumentation_status
+from lib.time_index import query_time_range, format_epoch, build_prefix_sums, range_totals, bucket_totals
+
+import numpy as np
+from threading import Lock
 
 class State:
     """
     A DTO encapsulating the program state.
     
     Initialized to contain no data, aggregation mode "minute", and to measure usage in watt-hour.
+    
+    Raw times are stored compactly as time keys (see "lib/epochs.py") in "raw_time_keys" sorted by time,
+    and only converted to the (N, 6) time format when accessing "raw_data".
+    Time keys keep dates as given, so raw data and its aggregations keep invalid dates (e.g. "2006-09-31").
+    "prefix_sums" is the prefix-sum index of the raw zones (see "build_prefix_sums"),
+    which answers usage totals of any time range or bucket width without aggregating.
+    It takes 32 bytes per measurement, so it is only built on first use and dropped whenever raw data changes.
+    
+    If "time_range" is set to a tuple "(start, end)" of seconds since epoch,
+    aggregation only uses raw data in the time range [start, end), found with binary search.
+    
+    Aggregated data is cached per aggregation mode for the current raw data and time range,
+    alongside the roll-up levels it is aggregated from in "rollup_levels" (all raw data),
+    and "range_levels" (raw data in the time range).
+    "raw_version" changes whenever raw data or the time range is set, which invalidates the cache.
+    Roll-up levels are only changed while locked, so levels are computed in private copies (see "get_raw_snapshot"),
+    and stored afterwards with "store_rollup_levels".
+    
+    If "compact" is true, raw data is stored with compact types (see "compact_time_keys" and "compact_measurements"),
+    which takes half the memory per measurement. Aggregations still sum in float64.
     """
 
-    def __init__(self):
-        self.raw_data = None
+    def __init__(self, compact=False):
+        self.compact = compact
+        self.raw_time_keys = None
+        self.raw_zones = None
+        self.prefix_sums = None
+        self.raw_version = 0
         self.aggregated_data = None
 
+        #NOTE: Cache may be filled from background threads, so access is locked
+        self.aggregation_cache = {}
+        self.rollup_levels = {}
+        self.range_levels = {}
+        self.aggregation_lock = Lock()
+        
+        self.time_range = None
+
         self.aggregation_mode = "minute"
         self.aggregation_status = None
         self.set_aggregation_mode(self.aggregation_mode)
@@ -18,12 +58,228 @@ class State:
         self.measurement_unit_status = "Usage in watt-hour"
 
 
+    def to_raw_types(self, time_keys, zones):
+        """
+        Method to convert times as time keys and zones to the types raw data is stored with
+        """
+        if self.compact:
+            return (compact_time_keys(time_keys), zones.astype(compact_zone_dtype))
+        else:
+            return (time_keys, zones)
+
+    def to_time_key_range(self, start=None, end=None):
+        """
+        Method to convert a time range [start, end) of seconds since epoch to time keys. "None" is kept as is.
+        """
+        return tuple(None if time is None else epochs_to_time_keys([time])[0] for time in (start, end))
+
     def set_raw_data(self, raw_data):
         """
         Method to set raw data as an alternative to direct assignment
         """
-        self.raw_data = raw_data
+        (times, zones) = raw_data
+        (time_keys, zones) = self.to_raw_types(*sort_by_epochs(times_to_time_keys(times), zones))
+
+        #Replace raw data and invalidate cached aggregations
+        with self.aggregation_lock:
+            self.raw_time_keys = time_keys
+            self.raw_zones = zones
+            self.prefix_sums = None
+            self.raw_version += 1
+            self.aggregation_cache = {}
+            self.rollup_levels = {}
+            self.range_levels = {}
+
+    def append_raw_data(self, raw_data):
+        """
+        Method to merge new raw data into the existing raw data.
+        New measurements replace existing measurements at the same times, and raw data is kept sorted by time.
+        Already computed roll-up levels are updated with the changed measurements instead of being recomputed.
+        """
+        #If there is no raw data, appending is the same as setting
+        if self.raw_time_keys is None:
+            self.set_raw_data(raw_data)
+            return
+
+        (new_times, new_zones) = raw_data
+        (new_time_keys, new_zones) = self.to_raw_types(times_to_time_keys(new_times), new_zones)
+
+        with self.aggregation_lock:
+            #Merge new raw data and find replaced measurements
+            (time_keys, zones, removed_time_keys, removed_zones) = merge_measurements(self.raw_time_keys, self.raw_zones,
+                                                                                      new_time_keys, new_zones)
+
+            #Replace raw data, update roll-up levels, and invalidate aggregated data
+            self.rollup_levels = update_rollup(self.rollup_levels, new_time_keys, new_zones,
+                                               removed_time_keys, removed_zones)
+            self.raw_time_keys = time_keys
+            self.raw_zones = zones
+            self.prefix_sums = None
+            self.raw_version += 1
+            self.aggregation_cache = {}
+            self.range_levels = {}
+
+    def set_time_range(self, time_range):
+        """
+        Method to restrict aggregation to raw data in a time range "(start, end)" of seconds since epoch.
+        Set to None to use all raw data.
+        """
+        with self.aggregation_lock:
+            self.time_range = time_range
+            self.raw_version += 1
+            self.aggregation_cache = {}
+            self.range_levels = {}
+
+    def get_raw_snapshot(self):
+        """
+        Method to get a consistent tuple "(raw_version, raw_time_keys, raw_zones, rollup_levels)" of the current raw data.
+        If a time range is set, only raw data in the time range and its roll-up levels are returned.
+        "rollup_levels" is a private copy, so levels can be added to it without the lock, see "store_rollup_levels".
+        """
+        with self.aggregation_lock:
+            #If no time range or no data, use all raw data
+            if self.time_range is None or self.raw_time_keys is None:
+                return (self.raw_version, self.raw_time_keys, self.raw_zones, dict(self.rollup_levels))
+            #Else, use views of raw data in the time range
+            else:
+                (time_keys, zones) = query_time_range(self.raw_time_keys, [self.raw_zones],
+                                                      *self.to_time_key_range(*self.time_range))
+                return (self.raw_version, time_keys, zones, dict(self.range_levels))
+
+    def store_rollup_levels(self, levels, raw_version):
+        """
+        Method to store roll-up levels computed in a copy from "get_raw_snapshot" for later aggregations.
+        Ignored if the raw data or time range has changed since "raw_version" was retrieved.
+        """
+        with self.aggregation_lock:
+            if raw_version == self.raw_version:
+                shared_levels = self.rollup_levels if self.time_range is None else self.range_levels
+                for period, level in levels.items():
+                    shared_levels.setdefault(period, level)
+
+    def query_raw_data(self, start=None, end=None):
+        """
+        Method to get a tuple "(time_keys, zones)" of views of all raw data in the time range [start, end) of seconds since epoch,
+        found with binary search. "None" leaves the range unbounded on that side.
+        Returns None if there is no raw data.
+        """
+        with self.aggregation_lock:
+            if self.raw_time_keys is None:
+                return None
+            else:
+                return query_time_range(self.raw_time_keys, [self.raw_zones], *self.to_time_key_range(start, end))
+
+    def query_aggregated_data(self, period, start=None, end=None):
+        """
+        Method to get aggregated data of all raw data for a period, restricted to groups starting in the time range [start, end).
+        Groups are found with binary search in the roll-up levels of all raw data, see "query_rollup".
+        Returns None if there is no raw data.
+        """
+        with self.aggregation_lock:
+            (time_keys, zones, shared_levels) = (self.raw_time_keys, self.raw_zones, self.rollup_levels)
+            levels = dict(shared_levels)
+
+        if time_keys is None:
+            return None
+
+        aggregated_data = query_rollup(time_keys, zones, period, levels, start, end)
+
+        #Store computed levels unless the raw data has changed in the meantime
+        with self.aggregation_lock:
+            if self.rollup_levels is shared_levels:
+                for period, level in levels.items():
+                    shared_levels.setdefault(period, level)
+
+        return aggregated_data
+
+    def get_cached_aggregation(self, period):
+        """
+        Method to get cached aggregated data of the current raw data for a period.
+        Returns None if not cached.
+        """
+        with self.aggregation_lock:
+            return self.aggregation_cache.get(period)
+
+    def cache_aggregation(self, period, aggregated_data, raw_version):
+        """
+        Method to cache aggregated data for a period.
+        Ignored if the raw data has changed since "raw_version" was retrieved.
+        """
+        with self.aggregation_lock:
+            if raw_version == self.raw_version:
+                self.aggregation_cache[period] = aggregated_data
+
+    def get_locked_prefix_sums(self):
+        """
+        Method to get the prefix-sum index of the raw zones, building it if not built yet.
+        
+        REMARK: Must be called while holding "aggregation_lock".
+        """
+        if self.prefix_sums is None:
+            self.prefix_sums = build_prefix_sums(self.raw_zones)
+
+        return self.prefix_sums
+
+    def get_range_totals(self, start=None, end=None):
+        """
+        Method to get the total usage of each zone of all raw data in the time range [start, end),
+        as an array of shape (4,). Answered from the prefix-sum index, see "range_totals".
+        Returns None if there is no raw data.
+        """
+        with self.aggregation_lock:
+            if self.raw_time_keys is None:
+                return None
+            else:
+                return range_totals(self.raw_time_keys, self.get_locked_prefix_sums(), *self.to_time_key_range(start, end))
+
+    def get_bucketed_data(self, width, start=None, end=None):
+        """
+        Method to get the usage of all raw data summed in buckets of "width" seconds (e.g. 900 for 15 minutes),
+        in the same format as aggregated data. Buckets without measurements are left out.
+        Answered from the prefix-sum index without grouping measurements, see "bucket_totals".
+        Returns None if there is no raw data.
+        
+        Raises a "ValueError" if "width" does not divide a day, as buckets are found in time keys,
+        where days are whole but months are not.
+        """
+        if seconds_per_day % width != 0:
+            raise ValueError(f"Bucket width must divide a day, got {width} seconds")
+
+        with self.aggregation_lock:
+            if self.raw_time_keys is None:
+                return None
+            else:
+                (bucket_keys, totals, counts) = bucket_totals(self.raw_time_keys, self.get_locked_prefix_sums(),
+                                                              width, *self.to_time_key_range(start, end))
+
+        #NOTE: Buckets of days that do not exist (e.g. February 30th) are always empty, and left out here
+        return (time_keys_to_times(bucket_keys[counts > 0]), totals[counts > 0])
+
+    @property
+    def raw_data(self):
+        """
+        Property to access raw data as a tuple of (N, 6) times and zones
+        """
+        if self.raw_time_keys is None:
+            return None
+        else:
+            return (time_keys_to_times(self.raw_time_keys, compact_time_dtype if self.compact else np.int64), self.raw_zones)
+
+    @raw_data.setter
+    def raw_data(self, raw_data):
+        self.set_raw_data(raw_data)
         
+    @property
+    def restricted_raw_data(self):
+        """
+        Property to access raw data in the time range (all raw data if none is set) like "raw_data"
+        """
+        (_, time_keys, zones, _) = self.get_raw_snapshot()
+        if time_keys is None:
+            return None
+        else:
+            return (time_keys_to_times(time_keys, compact_time_dtype if self.compact else np.int64), zones)
+
     def set_aggregation_mode(self, period):
         """
         Method to update aggregation mode and its associated status
@@ -54,6 +310,19 @@ class State:
     @property
     def status(self):
         """
-        Property to access statuses in list form
+        Property to access statuses in list form.
+        Includes the time range if restricted,
+        and a summary of the most recent pipeline stages when instrumentation is enabled.
         """
-        return [self.aggregation_status, self.measurement_unit_status]
+        status = [self.aggregation_status, self.measurement_unit_status]
+
+        #If restricted to a time range, show it
+        if self.time_range is not None:
+            status.append(f"Time range {format_epoch(self.time_range[0])} to {format_epoch(self.time_range[1])}")
+
+        #If instrumented, show the most recent stages
+        instrumentation_status = get_instrumentation_status()
+        if instrumentation_status is not None:
+            status.append(instrumentation_status)
+
+        return status
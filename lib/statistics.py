@@ -1,4 +1,9 @@
 from lib.ui_base import prompt_continue
+from lib.utilities import eprint
+from lib.data import zone_data_length
+from lib.sketch import QuantileSketch, default_sketch_error
+from lib.epochs import times_to_epochs, seconds_per_day, has_dates
+from lib.instrument import stage
 
 import numpy as np
 
@@ -7,6 +12,38 @@ table_column_width = 14
 table_header = ["Zones", "Minimum", "1. quart.", "2. quart.", "3. quart.", "Maximum"]
 table_row_name = ["1", "2", "3", "4", "All"]
 
+#Quantiles shown in the statistics table
+table_quantiles = [0.00, 0.25, 0.50, 0.75, 1.00]
+
+#Names of groups for grouped statistics
+month_names = ["Jan", "Feb", "Mar", "Apr", "May", "Jun", "Jul", "Aug", "Sep", "Oct", "Nov", "Dec"]
+weekday_names = ["Mon", "Tue", "Wed", "Thu", "Fri", "Sat", "Sun"]
+
+#Map from grouping to function that turns times into integer group keys
+#NOTE: 1970-01-01 was a Thursday, so days since epoch are shifted by 3 to make Monday 0
+grouping_to_key = {
+    "month": lambda times: times[:, 1] - 1,
+    "weekday": lambda times: (times_to_epochs(times) // seconds_per_day + 3) % 7,
+    "hour of the day": lambda times: times[:, 3],
+}
+
+#Map from grouping to function that turns an integer group key into a group name
+grouping_to_name = {
+    "month": lambda key: month_names[key],
+    "weekday": lambda key: weekday_names[key],
+    "hour of the day": lambda key: f"{key:02d}:00",
+}
+
+#Groupings that need dates, and are therefore unavailable for "hour of the day" aggregations
+dated_groupings = ["month", "weekday"]
+
+#Map from grouping to table header of the group column
+grouping_to_header = {
+    "month": "Month",
+    "weekday": "Weekday",
+    "hour of the day": "Hour",
+}
+
 
 def print_row(elements):
     """
@@ -19,11 +56,11 @@ def print_row(elements):
     print(row_spacing.format(*elements))
 
 
-def print_line():
+def print_line(columns=len(table_header)):
     """
     Print horizontal line that spans full width of table
     """
-    print("-" * table_column_width * len(table_header))
+    print("-" * table_column_width * columns)
     
 
 
@@ -31,21 +68,14 @@ def get_quartiles(zones):
     """
     Computes the minimum, 1., median, 3., maximum quartiles
     """
-    return np.quantile(zones, [0.00, 0.25, 0.50, 0.75, 1.00], axis=0)
+    return np.quantile(zones, table_quantiles, axis=0)
 
 
 
-def print_statistics(tvec, data):
+def print_quartile_table(quartiles):
     """
-    Compute and print quartile statistics about the provided data.
+    Print a statistics table of quartiles in the form [[zone1_quartiles...], ..., [total_quartiles...]].
     """
-    #Get quartiles for each zone and store in the form [[zone1_quartiles...], ...]
-    quartiles = get_quartiles(data).T
-    #Get quartiles for total usage
-    summed_quartiles = get_quartiles(data.sum(axis=1))
-    #Append "summed_quartiles" to "quartiles"
-    quartiles = np.append(quartiles, np.expand_dims(summed_quartiles, 0), axis=0)
-
     #Round all quartiles
     quartiles = np.round(quartiles, 2)
 
@@ -61,3 +91,184 @@ def print_statistics(tvec, data):
 
     #Print horizontal line
     print_line()
+
+
+def print_statistics(tvec, data):
+    """
+    Compute and print quartile statistics about the provided data.
+    """
+    with stage("statistics.quartiles", len(data)):
+        #Get quartiles for each zone and store in the form [[zone1_quartiles...], ...]
+        quartiles = get_quartiles(data).T
+        #Get quartiles for total usage
+        summed_quartiles = get_quartiles(data.sum(axis=1))
+    #Append "summed_quartiles" to "quartiles"
+    quartiles = np.append(quartiles, np.expand_dims(summed_quartiles, 0), axis=0)
+
+    #Print quartiles
+    print_quartile_table(quartiles)
+
+
+
+def print_totals(totals):
+    """
+    Print a table of the total usage of each zone, and of all zones combined.
+    """
+    #Print header and horizontal line
+    print_row([table_header[0], "Total"])
+    print_line(2)
+
+    #Print total of each zone and of all zones
+    for name, total in zip(table_row_name, np.append(totals, np.sum(totals))):
+        print_row([name, round(total, 2)])
+
+    #Print horizontal line
+    print_line(2)
+
+
+
+def get_grouped_quartiles(keys, values):
+    """
+    Computes the minimum, 1., median, 3., maximum quartiles of each group of values with the same integer key.
+    "values" is an array of shape (N,) or (N, columns).
+    
+    Returns a tuple "(group_keys, quartiles)" where "quartiles" has shape (groups, columns, 5),
+    or (groups, 5) for one dimensional values.
+    Quartiles are interpolated linearly like "get_quartiles".
+
+    Values are sorted by group key and value, and quartiles of all groups are then found with array indexing.
+
+    REMARK: Assumes keys are small non-negative integers (e.g. months, weekdays or hours).
+    """
+    values = np.asarray(values)
+    columns = values.reshape(len(values), -1)
+    #NOTE: Narrow keys allow numpy to use a linear time radix sort
+    keys = np.asarray(keys).astype(np.uint16)
+
+    #Find groups and their sizes by counting keys
+    key_counts = np.bincount(keys)
+    group_keys = np.flatnonzero(key_counts)
+    counts = key_counts[group_keys]
+    starts = np.cumsum(counts) - counts
+
+    #Find positions of the quantiles within each group of sorted values
+    positions = starts[:, None] + np.array(table_quantiles)[None, :] * (counts[:, None] - 1)
+    (lower, upper) = (np.floor(positions).astype(np.int64), np.ceil(positions).astype(np.int64))
+    fraction = positions - lower
+
+    #For each column, sort values within groups and interpolate quantiles
+    #NOTE: Sorting values first and then stable sorting by key keeps values sorted within groups
+    quartiles = np.empty((len(group_keys), columns.shape[1], len(table_quantiles)))
+    for c in range(columns.shape[1]):
+        value_order = np.argsort(columns[:, c])
+        value_order = value_order[np.argsort(keys[value_order], kind="stable")]
+        sorted_values = columns[value_order, c]
+
+        quartiles[:, c] = sorted_values[lower] + (sorted_values[upper] - sorted_values[lower]) * fraction
+
+    #Return quartiles in the same dimensions as values
+    return (group_keys, quartiles if values.ndim > 1 else quartiles[:, 0])
+
+
+def print_grouped_statistics(tvec, data, grouping):
+    """
+    Compute and print quartile statistics about the provided data, grouped by "grouping".
+    A table is printed for each zone and the total usage, with a row for each group.
+
+    Groupings in "dated_groupings" need times with dates.
+    Prints an error and nothing else for times without dates (i.e. "hour of the day" aggregations).
+
+    REMARK: Assumes "grouping" is one of:
+        "month"
+        "weekday"
+        "hour of the day"
+    """
+    #If grouping needs dates, but times have none, groups would be meaningless
+    if grouping in dated_groupings and not has_dates(tvec):
+        eprint(f"Unable to group by {grouping} as times have no dates. Aggregate by another mode first")
+        return
+
+    #Group by time and compute quartiles of each zone and the total usage at once
+    with stage("statistics.grouped_quartiles", len(data)):
+        keys = grouping_to_key[grouping](tvec)
+        values = np.append(data, data.sum(axis=1, keepdims=True), axis=1)
+        (group_keys, quartiles) = get_grouped_quartiles(keys, values)
+
+    #Round all quartiles
+    quartiles = np.round(quartiles, 2)
+
+    group_names = [grouping_to_name[grouping](key) for key in group_keys]
+
+
+    #Print a table for each zone and the total usage
+    for i, row_name in enumerate(table_row_name):
+        #Print table title, header, and horizontal line
+        print(f"Zones: {row_name}")
+        print_row([grouping_to_header[grouping], *table_header[1:]])
+        print_line()
+
+        #Print each group and its quartiles
+        for name, quartile in zip(group_names, quartiles[:, i]):
+            print_row([name, *quartile])
+
+        #Print horizontal line and space between tables
+        print_line()
+        print()
+
+
+
+def create_statistics_sketches(error=default_sketch_error):
+    """
+    Creates a list of quantile sketches, one for each zone and one for the total usage.
+    "error" is the approximate rank error of the sketches, see "QuantileSketch".
+    """
+    return [QuantileSketch(error) for _ in range(zone_data_length + 1)]
+
+def update_statistics_sketches(sketches, data):
+    """
+    Adds a chunk of zone measurements to statistics sketches.
+    """
+    #Add each zone to its own sketch
+    for i in range(zone_data_length):
+        sketches[i].update(data[:, i])
+
+    #Add total usage to the last sketch
+    sketches[-1].update(data.sum(axis=1))
+
+def merge_statistics_sketches(sketches, other_sketches):
+    """
+    Adds all measurements of other statistics sketches (e.g. from another file or worker) to statistics sketches.
+    """
+    for sketch, other_sketch in zip(sketches, other_sketches):
+        sketch.merge(other_sketch)
+
+def get_sketch_quartiles(sketches):
+    """
+    Computes approximate quartiles from statistics sketches in the form [[zone1_quartiles...], ..., [total_quartiles...]].
+    """
+    return np.array([sketch.quantile(table_quantiles) for sketch in sketches])
+
+
+def print_streaming_statistics(blocks, error=default_sketch_error):
+    """
+    Compute and print approximate quartile statistics about data provided in blocks of "(tvec, data)",
+    e.g. from "stream_measurements".
+    Only one block is kept in memory at a time, so the data can be far larger than memory.
+    "error" is the approximate rank error of the quartiles, while the minimum and maximum are exact.
+    
+    Returns the statistics sketches, so they can be merged with sketches of other data.
+    """
+    #Feed each block into the sketches
+    sketches = create_statistics_sketches(error)
+    for (_, data) in blocks:
+        update_statistics_sketches(sketches, data)
+
+    #If there were no measurements, there are no quartiles to print
+    if sketches[-1].count == 0:
+        eprint("No measurements to compute statistics of")
+        return sketches
+
+    #Print quartiles
+    print_quartile_table(get_sketch_quartiles(sketches))
+
+    return sketches
@@ -0,0 +1,130 @@
+from lib.data_fill_processors import time_data_length
+from lib.data import sort_by_epochs
+from lib.epochs import times_to_epochs, epochs_to_times, epochs_to_datetimes
+
+import numpy as np
+
+
+"""
+Time range queries over measurements sorted by time.
+
+Times are given as seconds since epoch (see "lib/epochs.py"), and ranges are half-open [start, end).
+Rows within a range are found with binary search, and returned as slices (views) of the original arrays,
+so a query costs O(log N) regardless of the number of measurements, and copies nothing.
+
+A prefix-sum index (see "build_prefix_sums") additionally answers total usage within a range
+with two binary searches and a subtraction, and sums buckets of any width without grouping measurements.
+"""
+
+
+
+def time_range_slice(epochs, start=None, end=None):
+    """
+    Returns the slice of sorted seconds since epoch "epochs" that is within the time range [start, end).
+    Found with binary search, so only a few elements of "epochs" are read.
+    "None" leaves the range unbounded on that side.
+    """
+    lower = 0 if start is None else np.searchsorted(epochs, start, side="left")
+    upper = len(epochs) if end is None else np.searchsorted(epochs, end, side="left")
+
+    return slice(lower, max(lower, upper))
+
+
+def query_time_range(epochs, arrays, start=None, end=None):
+    """
+    Returns a tuple of views of "epochs" and each array in "arrays" restricted to rows in the time range [start, end).
+    "arrays" share their rows with the sorted seconds since epoch "epochs". See "time_range_slice".
+    """
+    rows = time_range_slice(epochs, start, end)
+    return (epochs[rows], *(array[rows] for array in arrays))
+
+
+def restrict_measurements(tvec, data, start=None, end=None):
+    """
+    Restricts measurements "(tvec, data)" to times in the range [start, end), and returns them sorted by time.
+    Returns views of the measurements if they are already sorted.
+    """
+    (epochs, tvec, data) = sort_by_epochs(times_to_epochs(tvec), tvec, data)
+
+    (_, tvec, data) = query_time_range(epochs, [tvec, data], start, end)
+    return (tvec, data)
+
+
+
+def build_prefix_sums(zones):
+    """
+    Builds the prefix-sum index of zone measurements sorted by time.
+    Returns an (N + 1, zones) float64 array, where row "i" is the sum of the first "i" rows of "zones",
+    so the sum of rows [i, j) is "prefix_sums[j] - prefix_sums[i]".
+
+    REMARK: Totals are differences of running sums, so their absolute rounding error grows with the
+    total usage before the range rather than with the usage within it (about 1e-16 of the running sum).
+    """
+    prefix_sums = np.zeros((len(zones) + 1, zones.shape[1]))
+    np.cumsum(zones, axis=0, dtype=np.float64, out=prefix_sums[1:])
+
+    return prefix_sums
+
+
+def range_totals(epochs, prefix_sums, start=None, end=None):
+    """
+    Returns the total usage of each zone in the time range [start, end) as an array of shape (zones,).
+    "epochs" are the sorted seconds since epoch the prefix sums "prefix_sums" were built for.
+    Costs two binary searches and a subtraction. "None" leaves the range unbounded on that side.
+    """
+    rows = time_range_slice(epochs, start, end)
+    return prefix_sums[rows.stop] - prefix_sums[rows.start]
+
+
+def bucket_totals(epochs, prefix_sums, width, start=None, end=None):
+    """
+    Sums zone measurements in buckets of "width" seconds (e.g. 900 for 15 minutes),
+    aligned to whole multiples of "width" since epoch.
+    Only buckets starting within the time range [start, end) are returned,
+    which defaults to all buckets with measurements.
+
+    Returns a tuple "(bucket_epochs, totals, counts)" of the start of each bucket, the total usage of each zone,
+    and the number of measurements in each bucket. Buckets without measurements are included.
+    Costs a binary search per bucket, independent of the number of measurements in each bucket.
+    """
+    #If empty, there are no buckets
+    if len(epochs) == 0:
+        return (np.empty(0, dtype=np.int64), prefix_sums[:0], np.empty(0, dtype=np.int64))
+
+    #Find the first bucket starting within the range, and the end of the range
+    first = -(-int(start) // width) * width if start is not None else int(epochs[0]) // width * width
+    last = int(end) if end is not None else int(epochs[-1]) + 1
+
+    #Find the measurements within each bucket and sum them with the prefix sums
+    bucket_epochs = np.arange(first, max(first, last), width, dtype=np.int64)
+    rows = np.searchsorted(epochs, np.append(bucket_epochs, bucket_epochs[-1:] + width), side="left")
+
+    return (bucket_epochs, np.diff(prefix_sums[rows], axis=0), np.diff(rows))
+
+
+
+def dates_to_epochs(dates):
+    """
+    Converts an array of dates given as "YYYYMMDD" numbers (e.g. 20080131) to seconds since epoch at midnight.
+    Raises a "ValueError" if any number is not a valid date.
+    """
+    dates = np.asarray(dates, dtype=np.int64)
+    (years, months, days) = (dates // 10000, dates // 100 % 100, dates % 100)
+
+    #Convert via times, and check the date did not roll over (e.g. 20060931)
+    times = np.zeros((len(dates), time_data_length), dtype=np.int64)
+    (times[:, 0], times[:, 1], times[:, 2]) = (years, months, days)
+    epochs = times_to_epochs(times)
+
+    valid = np.all(epochs_to_times(epochs) == times, axis=1)
+    if not np.all(valid):
+        raise ValueError(f"Invalid date: {dates[~valid][0]}, expected YYYYMMDD")
+
+    return epochs
+
+
+def format_epoch(epoch):
+    """
+    Formats seconds since epoch as a readable date and time, e.g. "2008-01-31 12:00"
+    """
+    return str(epochs_to_datetimes([epoch])[0].astype("datetime64[m]")).replace("T", " ")
@@ -1,45 +1,79 @@
 from lib.ui_base import prompt_continue, prompt_options
-from lib.data import file_exists, load_measurements
-from lib.aggregate import aggregate_sort_data
+from lib.ui_utilities import inform_if_data_unavailable
+from lib.data import file_exists, expand_paths, load_measurements, load_many_measurements
+from lib.columnar import is_columnar_path, load_columnar_measurements, save_measurements
+from lib.aggregate import aggregate_sort_data, warm_aggregation_cache
+from lib.utilities import eprint
 
 from os import getcwd, path
 
 
+def load_path(path, fmode):
+    """
+    Loads measurements from a file, or from all files matching a glob pattern in parallel.
+    Measurements saved in a columnar format are loaded as they are, ignoring "fmode".
+    """
+    #If path leads to saved columnar measurements, load them directly
+    if is_columnar_path(path):
+        return load_columnar_measurements(path)
+    #Else if path leads to a file, load just that file
+    elif file_exists(path):
+        return load_measurements(path, fmode)
+    #Else, load all matching files and ignore files with errors
+    else:
+        (tvec, data, _) = load_many_measurements(path, fmode)
+        return (tvec, data)
+
+
 def data_loader_action(state, path, fmode):
     """
     Informs user data is being loaded and then loads raw data into program state with the specified fill mode.
     """
-    return lambda: print("Loading data...") or state.set_raw_data(load_measurements(path, fmode))
+    return lambda: print("Loading data...") or state.set_raw_data(load_path(path, fmode))
+
+def data_appender_action(state, path, fmode):
+    """
+    Informs user data is being appended and then merges raw data into program state with the specified fill mode.
+    """
+    return lambda: print("Appending data...") or state.append_raw_data(load_path(path, fmode))
 
 
-def display_load_data_menu(state):
+def display_load_data_menu(state, data_action=data_loader_action):
     """
     Prompt user to input a file path and then loads the contents into the program state.
+    The path may also be a glob pattern (e.g. "data/*.csv"), in which case all matching files are loaded in parallel.
     If unable to load the file, program state is not changed.
+    
+    "data_action" creates the function that stores the loaded data in program state.
     """
     
     #Prompt for file path
-    print("Input data file path:")
+    print("Input data file path or pattern:")
     data_path = input(getcwd() + path.sep)
 
     #Print empty line for readability
     print()
 
 
-    #If file exists, load data
-    if file_exists(data_path):
+    #If file exists or pattern matches files, load data
+    if is_columnar_path(data_path) or file_exists(data_path) or len(expand_paths(data_path)) > 0:
         #Create helper function to load data with different fill modes
-        dl_action = lambda fmode: data_loader_action(state, data_path, fmode)
+        dl_action = lambda fmode: data_action(state, data_path, fmode)
         
-        #Create fill mode menu
-        fill_mode_menu = [
-            ("Fill corrupted with latest valid", dl_action("forward fill")),
-            ("Fill corrupted with next valid",   dl_action("backward fill")),
-            ("Drop corrupted",                   dl_action("drop"))
-        ]
+        #If saved columnar measurements, they are already normalized
+        if is_columnar_path(data_path):
+            dl_action(None)()
+        #Else, prompt for fill mode and load data
+        else:
+            #Create fill mode menu
+            fill_mode_menu = [
+                ("Fill corrupted with latest valid", dl_action("forward fill")),
+                ("Fill corrupted with next valid",   dl_action("backward fill")),
+                ("Drop corrupted",                   dl_action("drop"))
+            ]
 
-        #Prompt for fill mode and load data
-        prompt_options(fill_mode_menu)
+            #Prompt for fill mode and load data
+            prompt_options(fill_mode_menu)
 
         #Finished loading data
         print("Loaded data", end="\n\n")
@@ -47,9 +81,69 @@ def display_load_data_menu(state):
         #Aggregate data
         aggregate_sort_data(state)
 
+        #Aggregate other modes in the background, so switching aggregation mode is instant
+        warm_aggregation_cache(state)
+
 
         #Prompt user to contiue
         prompt_continue()
     #Else, inform user of failure, prompt to continue
     else:
-        prompt_continue("Path does not lead to a file - press enter to continue...", start_newline=True)
+        prompt_continue("Path does not lead to a file or match any files - press enter to continue...", start_newline=True)
+
+
+def display_append_data_menu(state):
+    """
+    Prompt user to input a file path and then merges the contents into the data in program state.
+    Measurements at times already in program state are replaced.
+    If unable to load the file, program state is not changed.
+    """
+    display_load_data_menu(state, data_appender_action)
+
+
+def data_saver(path, get_measurements):
+    """
+    Returns a function that saves the measurements returned by "get_measurements" to a path in a columnar format,
+    and informs the user of failures.
+    """
+    def save():
+        print("Saving data...")
+        try:
+            save_measurements(path, *get_measurements())
+            print("Saved data")
+        except Exception as e:
+            eprint(f"Could not save to {path}: {e}")
+
+    return save
+
+
+def display_save_data_menu(state):
+    """
+    Prompt user to input a path and then saves raw or aggregated data to it in a columnar format.
+    Paths ending in ".parquet" or ".arrow" are saved as Parquet or Arrow files (requires pyarrow),
+    and any other path as a folder of NumPy files. Saved data can be loaded again with "Load data".
+    Does not continue if there is no data available.
+    """
+    #If no data is unavailable, inform user and return
+    if inform_if_data_unavailable(state.aggregated_zones):
+        return
+
+    #Prompt for path
+    print("Input path to save to (.parquet, .arrow, or a folder):")
+    save_path = input(getcwd() + path.sep)
+
+    #Print empty line for readability
+    print()
+
+
+    #Create menu to prompt user for the data to save
+    save_menu = [
+        ("Raw data",        data_saver(save_path, lambda: state.raw_data)),
+        ("Aggregated data", data_saver(save_path, lambda: state.aggregated_data)),
+    ]
+
+    #Prompt for data and save it
+    prompt_options(save_menu, state.status)
+
+    #Prompt user to contiue
+    prompt_continue(start_newline=True)
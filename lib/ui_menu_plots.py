@@ -1,6 +1,12 @@
-from lib.ui_base import prompt_options
+from lib.ui_base import prompt_continue, prompt_options
 from lib.ui_utilities import inform_if_data_unavailable
 from lib.plot import show_plot
+from lib.export import export_plots
+from lib.aggregate import period_to_columns
+from lib.epochs import has_dates
+from lib.rolling import rolling_windows, rolling_measurements
+
+from os import getcwd, path
 
 
 def plot_shower(state, combined_plot):
@@ -11,6 +17,66 @@ def plot_shower(state, combined_plot):
     return lambda: show_plot(*state.aggregated_data, combined=combined_plot, labels=state.status)
 
 
+def show_rolling_plot(state, combined_plot, window_name):
+    """
+    Opens a plot of the aggregated data with its moving average over the window "window_name" drawn over it.
+    See "plot_shower" and "rolling_windows".
+    """
+    rolling_means = rolling_measurements(*state.aggregated_data, rolling_windows[window_name])
+    show_plot(*state.aggregated_data, combined=combined_plot, labels=state.status,
+              overlays=[(f"{window_name} average", rolling_means)])
+
+
+def rolling_plot_shower(state, combined_plot):
+    """
+    Returns a function that prompts the user for a window, and opens a plot with the moving average over it.
+    Informs the user instead if the aggregated data has no dates (i.e. "hour of the day").
+    """
+    def show():
+        #If times have no dates, there is no time to roll over
+        if not has_dates(state.aggregated_times):
+            prompt_continue("Moving averages are unavailable for \"hour of the day\" - press enter to continue...")
+            return
+
+        #Create menu to prompt user for window
+        windows_menu = [
+            (window_name, lambda window_name=window_name: show_rolling_plot(state, combined_plot, window_name))
+            for window_name in rolling_windows
+        ]
+
+        prompt_options(windows_menu, state.status, msg="Choose a moving average window:")
+
+    return show
+
+
+def export_all_plots(state):
+    """
+    Prompt user to input a directory and then saves zone and combined plots of all aggregation modes to it as PNG files.
+    Only raw data in the restricted time range is plotted, like the shown plots.
+    """
+    #Prompt for directory path
+    print("Input export directory path:")
+    export_path = input(getcwd() + path.sep)
+
+    #Print empty line for readability
+    print()
+
+
+    #Render and save plots, inform user if the directory cannot be written
+    print("Exporting plots...")
+    try:
+        saved_paths = export_plots(*state.restricted_raw_data, list(period_to_columns), export_path,
+                                   measurement_unit_status=state.measurement_unit_status)
+    except OSError as e:
+        prompt_continue(f"Could not export plots to {export_path}: {e} - press enter to continue...",
+                        start_newline=True)
+        return
+
+    #Inform user of exported files and prompt to continue
+    print(f"Exported {len(saved_paths)} plots")
+    prompt_continue(start_newline=True)
+
+
 def display_plots_menu(state):
     """
     Opens a GUI to show the aggregated data with plots.
@@ -24,7 +90,10 @@ def display_plots_menu(state):
     #Create menu to prompt user for plot type
     plots_menu = [
         ("Zone usage",     plot_shower(state, combined_plot=False)),
-        ("Combined usage", plot_shower(state, combined_plot=True))
+        ("Combined usage", plot_shower(state, combined_plot=True)),
+        ("Zone usage with moving average",     rolling_plot_shower(state, combined_plot=False)),
+        ("Combined usage with moving average", rolling_plot_shower(state, combined_plot=True)),
+        ("Export all aggregation modes to files", lambda: export_all_plots(state))
     ]
 
     #Prompt user for plot type and show plot afterwards
@@ -1,6 +1,6 @@
-from lib.ui_base import prompt_continue
+from lib.ui_base import prompt_continue, prompt_options
 from lib.ui_utilities import inform_if_data_unavailable
-from lib.statistics import print_statistics
+from lib.statistics import print_statistics, print_grouped_statistics
 
 
 def display_statistics(state):
@@ -23,3 +23,38 @@ def display_statistics(state):
 
     #Prompt user to continue once ready
     prompt_continue(start_newline=True)
+
+
+def grouped_statistics_printer(state, grouping):
+    """
+    Returns a function that prints statistics on aggregated data grouped by "grouping".
+    """
+    return lambda: print_grouped_statistics(*state.aggregated_data, grouping)
+
+
+def display_grouped_statistics(state):
+    """
+    Show statistics on aggregated data grouped by month, weekday, or hour of the day.
+    Does not continue if there is no data available.
+    """
+    #If no data is unavailable, inform user and return
+    if inform_if_data_unavailable(state.aggregated_zones):
+        return
+
+    #Create menu to prompt user for grouping
+    grouping_menu = [
+        ("By month",           grouped_statistics_printer(state, "month")),
+        ("By weekday",         grouped_statistics_printer(state, "weekday")),
+        ("By hour of the day", grouped_statistics_printer(state, "hour of the day"))
+    ]
+
+    #Prompt user for grouping, then calculate and print statistics
+    prompt_options(grouping_menu, state.status)
+    
+    #Print aggregation mode and measurement unit
+    for s in state.status:
+        print(s)
+
+
+    #Prompt user to continue once ready
+    prompt_continue(start_newline=True)
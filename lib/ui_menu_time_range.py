@@ -0,0 +1,87 @@
+from lib.ui_base import prompt_continue, prompt_options, prompt_range
+from lib.ui_utilities import check_data_unavailable
+from lib.aggregate import aggregate_sort_data, warm_aggregation_cache
+from lib.statistics import print_totals
+from lib.time_index import dates_to_epochs, format_epoch
+
+
+#Range of accepted "YYYYMMDD" dates (years with four digits)
+min_date = 10000101
+max_date = 99991231
+
+
+
+def prompt_date_range(state):
+    """
+    Prompt user for a date range and return it as a tuple "(start, end)" of seconds since epoch.
+    Dates are input as "YYYYMMDD" numbers, where the first date is inclusive and the last date is exclusive.
+    Returns None and informs the user if a date is invalid.
+    """
+    #Prompt for date range
+    (first_date, last_date) = prompt_range(state.status, inline_msg="YYYYMMDD> ")
+
+    #Convert dates to seconds since epoch, inform user if invalid
+    #NOTE: Dates are parsed as floats, so they are range checked before converting them to integers,
+    # as they may be infinite or too large for integer arrays
+    try:
+        for date in (first_date, last_date):
+            if not min_date <= date <= max_date:
+                raise ValueError(f"Invalid date: {date:g}, expected YYYYMMDD from {min_date} to {max_date}")
+
+        return tuple(dates_to_epochs([int(first_date), int(last_date)]))
+    except (ValueError, OverflowError) as e:
+        prompt_continue(f"{e} - press enter to continue...", start_newline=True)
+        return None
+
+
+def restrict_time_range(state):
+    """
+    Prompt user for a date range and restrict aggregation to raw data within it.
+    """
+    time_range = prompt_date_range(state)
+
+    #If valid, restrict time range
+    if time_range is not None:
+        state.set_time_range(time_range)
+
+
+def display_range_totals(state):
+    """
+    Prompt user for a date range and show the total usage of each zone within it.
+    Totals are answered from the prefix-sum index of all raw data, regardless of the restricted time range.
+    """
+    time_range = prompt_date_range(state)
+
+    #If valid, print totals and prompt user to continue once ready
+    if time_range is not None:
+        print(f"Usage from {format_epoch(time_range[0])} to {format_epoch(time_range[1])}")
+        print_totals(state.get_range_totals(*time_range))
+        print(state.measurement_unit_status)
+
+        prompt_continue(start_newline=True)
+
+
+def display_time_range_menu(state):
+    """
+    Show menu to restrict aggregation, statistics and plots to a time range, or to show all data again.
+    Does not continue if there is no data available.
+    """
+    #If no data is loaded, inform user and return
+    if check_data_unavailable(state.raw_zones):
+        prompt_continue("Unable to execute operation.\nNo data loaded.\n\nPress enter to continue...")
+        return
+
+    #Create menu to prompt user for time range
+    time_range_menu = [
+        ("Restrict to a date range",            lambda: restrict_time_range(state)),
+        ("Show all data",                       lambda: state.set_time_range(None)),
+        ("Show usage totals in a date range",   lambda: display_range_totals(state)),
+    ]
+
+    #Prompt user for time range
+    prompt_options(time_range_menu, state.status)
+
+
+    #Update aggregated data, and aggregate other modes in the background
+    aggregate_sort_data(state)
+    warm_aggregation_cache(state)
@@ -1,11 +1,15 @@
 from lib.state import State
 from lib.ui_menu_main import display_main_menu
-from lib.ui_menu_data import display_load_data_menu
+from lib.ui_menu_data import display_load_data_menu, display_append_data_menu, display_save_data_menu
 from lib.ui_menu_aggregate import display_aggregate_menu
-from lib.ui_menu_statistics import display_statistics
+from lib.ui_menu_time_range import display_time_range_menu
+from lib.ui_menu_statistics import display_statistics, display_grouped_statistics
 from lib.ui_menu_plots import display_plots_menu
+from lib.cli import run_pipeline
+from lib.instrument import enable_instrumentation
 
-from sys import exit
+from os import environ
+from sys import argv, exit
 
 
 """
@@ -85,39 +89,72 @@ No author for the different files have been specified as there is only one.
 
 
 """
-The program state consists of:
-    Raw data loaded in
-    Aggregated data of the raw data
-    Aggregation mode (period)
-    Status messages
+The program is only run when this file is executed directly.
+Worker processes (e.g. loading files in parallel) may import this file again under the "spawn" start method,
+which is the default on Windows and macOS, and must not start the program themselves.
 """
-#Initialize state of program
-state = State()
-
-
-"""
-The following section defines the main menu of the program.
-Menus are defined as lists of tuples,
-where the first element in the tuple is the menu option text,
-while the second element in the tuple is the function to call if the option is selected.
-
-The state of the program is passed into each menu option function, 
-except the "Quit" option as it does not need the program state.
-"""
-
-#Define main menu of the program. This is where the program starts.
-main_menu = [
-    #Parameter is program state
-    ("Load data",                         lambda: display_load_data_menu(state)),
-    ("Aggregate data",                    lambda: display_aggregate_menu(state)),
-    ("Display statistics",                lambda: display_statistics(state)),
-    ("Visualize electricity consumption", lambda: display_plots_menu(state)),
-    #Option to close the program
-    ("Quit",                              exit),
-]
-
-
-#At this point, the program state and main menu has been initialized
-
-#Show the main menu
-display_main_menu(state, main_menu)
+if __name__ == "__main__":
+    """
+    If command-line arguments are given, the program runs as a non-interactive pipeline instead,
+    which loads, aggregates, prints statistics and exports plots without any prompts.
+    See "lib/cli.py" or run "python main.py --help" for the available arguments.
+    """
+    if len(argv) > 1:
+        exit(run_pipeline(argv[1:]))
+
+
+
+    """
+    The program state consists of:
+        Raw data loaded in
+        Aggregated data of the raw data
+        Aggregation mode (period)
+        Time range aggregation is restricted to
+        Status messages
+
+    If the "ELECTRICITY_COMPACT" environment variable is set,
+    raw data is stored with compact types to fit more measurements in memory (see "lib/state.py").
+    """
+    #Initialize state of program
+    state = State(compact="ELECTRICITY_COMPACT" in environ)
+
+
+    """
+    If the "ELECTRICITY_TRACE" environment variable is set to a file path,
+    the time, rows and memory of each pipeline stage are recorded and appended as JSON lines to that file.
+    A summary of the most recent stages is then shown with the status messages.
+    """
+    if "ELECTRICITY_TRACE" in environ:
+        enable_instrumentation(environ["ELECTRICITY_TRACE"])
+
+
+    """
+    The following section defines the main menu of the program.
+    Menus are defined as lists of tuples,
+    where the first element in the tuple is the menu option text,
+    while the second element in the tuple is the function to call if the option is selected.
+
+    The state of the program is passed into each menu option function, 
+    except the "Quit" option as it does not need the program state.
+    """
+
+    #Define main menu of the program. This is where the program starts.
+    main_menu = [
+        #Parameter is program state
+        ("Load data",                         lambda: display_load_data_menu(state)),
+        ("Append data",                       lambda: display_append_data_menu(state)),
+        ("Save data",                         lambda: display_save_data_menu(state)),
+        ("Aggregate data",                    lambda: display_aggregate_menu(state)),
+        ("Restrict time range",               lambda: display_time_range_menu(state)),
+        ("Display statistics",                lambda: display_statistics(state)),
+        ("Display grouped statistics",        lambda: display_grouped_statistics(state)),
+        ("Visualize electricity consumption", lambda: display_plots_menu(state)),
+        #Option to close the program
+        ("Quit",                              exit),
+    ]
+
+
+    #At this point, the program state and main menu has been initialized
+
+    #Show the main menu
+    display_main_menu(state, main_menu)